@@ -66,7 +66,7 @@ export default function Dashboard() {
   }, []);
 
   // --------------------------------------------------
-  // ON MOUNT → Fetch user + classes + start interval
+  // ON MOUNT → Fetch user + classes
   // --------------------------------------------------
   useEffect(() => {
     const init = async () => {
@@ -77,13 +77,18 @@ export default function Dashboard() {
 
     init();
 
-    // Auto update every 30 sec
-    const interval = setInterval(() => {
-      fetchUser();
-      fetchClasses();
-    }, 30000);
+    // profile + class list only change through this user's own actions
+    // (join / create happen on other pages), so refetch when the tab comes
+    // back into view instead of polling every 30 sec
+    const onVisible = () => {
+      if (document.visibilityState === "visible") {
+        fetchUser();
+        fetchClasses();
+      }
+    };
+    document.addEventListener("visibilitychange", onVisible);
 
-    return () => clearInterval(interval);
+    return () => document.removeEventListener("visibilitychange", onVisible);
   }, [fetchUser, fetchClasses]);
 
   // --------------------------------------------------
@@ -11,6 +11,8 @@ export default function FaceSession() {
   const webcamRef = useRef(null);
   const [imagePreview, setImagePreview] = useState(null);
   const API = import.meta.env.VITE_API_BASE || "http://localhost:8000";
+  // face endpoints can live on separate vision workers (WORKER_ROLE=vision)
+  const VISION_API = import.meta.env.VITE_VISION_BASE || API;
 
   // -----------------------------
   // CAPTURE IMAGE FROM CAMERA
@@ -43,7 +45,7 @@ export default function FaceSession() {
     formData.append("file", blob, "classroom.png");
     formData.append("class_id", id);
 
-    const res = await fetch(`${API}/attendance/face-session`, {
+    const res = await fetch(`${VISION_API}/attendance/face-session`, {
       method: "POST",
       headers: { Authorization: `Bearer ${token}` },
       body: formData,
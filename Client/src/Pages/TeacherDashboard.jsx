@@ -1,4 +1,4 @@
-import React, { useEffect, useState, useCallback } from "react";
+import React, { useEffect, useState, useCallback, useRef } from "react";
 import { useParams, useNavigate } from "react-router-dom";
 import Sidebar from "../Components/Dasboard/Sidebar"; // adjust path if needed
 import ClassHeader from "../Components/Classroom/ClassHeader";
@@ -55,6 +55,29 @@ export default function TeacherDashboard() {
     usn: user.usn || "No USN Found",  
   };
 
+  // classes taken behind the summary rows (live events carry theirs)
+  const summarySessions = useRef(null);
+
+  const fetchSummary = useCallback(async () => {
+    const sumRes = await fetch(`${API_BASE}/class/${id}/attendance/summary`, {
+      headers: { Authorization: `Bearer ${token}` }
+    });
+
+    if (sumRes.ok) {
+      const sumJson = await sumRes.json();
+      console.log("SUMMARY:", sumJson);
+
+      if (sumJson.success && Array.isArray(sumJson.summary)) {
+        summarySessions.current = sumJson.sessions;
+        setSummary(sumJson.summary);
+      } else {
+        setSummary([]);
+      }
+    } else {
+      setSummary([]);
+    }
+  }, [id, token]);
+
   const fetchData = useCallback(async () => {
     setLoading(true);
 
@@ -109,22 +132,7 @@ export default function TeacherDashboard() {
       }
 
       // -------------- FETCH JOINED STUDENT SUMMARY --------------
-      const sumRes = await fetch(`${API_BASE}/class/${id}/attendance/summary`, {
-        headers: { Authorization: `Bearer ${token}` }
-      });
-
-      if (sumRes.ok) {
-        const sumJson = await sumRes.json();
-        console.log("SUMMARY:", sumJson);
-
-        if (sumJson.success && Array.isArray(sumJson.summary)) {
-          setSummary(sumJson.summary);
-        } else {
-          setSummary([]);
-        }
-      } else {
-        setSummary([]);
-      }
+      await fetchSummary();
 
     } catch (err) {
       console.error("Error fetching dashboard data:", err);
@@ -134,12 +142,61 @@ export default function TeacherDashboard() {
       setLoading(false);
     }
 
-  }, [id, token, navigate]);
+  }, [id, token, navigate, fetchSummary]);
 
   useEffect(() => {
     fetchData();
   }, [fetchData]);
 
+  // ---------------- LIVE UPDATES (server push instead of refetching) ----------------
+  // EventSource cannot send headers, the token goes in the query string
+  useEffect(() => {
+    if (!token) return;
+    const source = new EventSource(`${API_BASE}/class/${id}/live?token=${encodeURIComponent(token)}`);
+    let connected = false;
+
+    // the first "ready" comes right after our initial fetch; a later one
+    // means the stream reconnected and events may have been missed
+    source.addEventListener("ready", () => {
+      if (connected) fetchData();
+      connected = true;
+    });
+
+    // face session marked students present -> patch today's rows
+    source.addEventListener("attendance", (e) => {
+      const data = JSON.parse(e.data);
+      const seen = new Set(data.present.map((p) => p.student_id));
+      setAttendance((rows) =>
+        rows.map((r) =>
+          seen.has(r.student_id)
+            ? { ...r, status: "present", timestamp: r.timestamp || data.seenAt }
+            : r
+        )
+      );
+
+      // a new meeting changes everyone's percentage -> refetch once,
+      // otherwise patch the rows of the students just seen
+      if (data.sessions !== summarySessions.current) {
+        fetchSummary();
+        return;
+      }
+      const updates = data.summary || {};
+      setSummary((rows) =>
+        rows.map((r) => (updates[r.student_id] ? { ...r, ...updates[r.student_id] } : r))
+      );
+    });
+
+    source.addEventListener("notice", (e) => {
+      const data = JSON.parse(e.data);
+      setClassData((prev) => ({ ...(prev || {}), notice: data.notice }));
+    });
+
+    // we fell behind and missed events -> one full refetch
+    source.addEventListener("resync", () => fetchData());
+
+    return () => source.close();
+  }, [id, token, fetchData, fetchSummary]);
+
   const handlePublishNotice = async () => {
     if (!noticeText || noticeText.trim().length < 3) {
       alert("Enter a short notice before publishing");
@@ -0,0 +1,233 @@
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from db import users_col, attendance_col, counters_col
+from sessions import session_dates
+from models import STUDENT_ROW_PROJECTION, to_object_ids
+
+# ---------------------------
+# attendance summary engine
+# ---------------------------
+# one counters lookup + one $in user lookup, whatever the class size.
+# Shared by /class/{id}, /attendance/summary and the summary CSV.
+#
+# attendance_counters keeps one document per class, see counters_doc.
+# sessions is bumped when a meeting opens (sessions.open_session). Rows are
+# only ever created by mark_present (always present=True), which $incs the
+# class document for every row it inserts -- one atomic update, so a
+# re-sent session never counts twice. Classes without a counters document
+# are recounted on first read; `manage.py counters verify|rebuild` reconciles.
+
+
+def counters_doc(total=0, attended=None):
+    """{sessions: <classes taken>, present: {student_id_str: attended}}"""
+    return {"sessions": total, "present": attended or {}}
+
+
+def percent(attended, total):
+    return round((attended / total) * 100) if total > 0 else 0
+
+
+async def raw_attendance_counts(class_id):
+    """(classes taken, {student_id_str: attended}) counted from the raw data.
+
+    Classes taken = distinct meeting dates, from the sessions and from the
+    attendance rows (rows written before sessions existed have no session).
+    """
+    pipeline = [
+        {"$match": {"class_id": ObjectId(class_id)}},
+        {"$group": {
+            "_id": "$student_id",
+            "attended": {"$sum": {"$cond": [{"$eq": ["$present", True]}, 1, 0]}},
+        }},
+    ]
+    attended = {}
+    async for row in await attendance_col.aggregate(pipeline):
+        attended[str(row["_id"])] = row["attended"]
+    dates = set(await attendance_col.distinct("date", {"class_id": ObjectId(class_id)}))
+    dates.update(await session_dates(class_id))
+    return len(dates), attended
+
+
+async def rebuild_counters(class_id):
+    """Recount one class from the raw rows and store the result."""
+    total, attended = await raw_attendance_counts(class_id)
+    await counters_col.replace_one(
+        {"_id": ObjectId(class_id)},
+        {**counters_doc(total, attended), "updatedAt": datetime.utcnow()},
+        upsert=True,
+    )
+    return total, attended
+
+
+async def verify_counters(class_id):
+    """Compare the stored counters with the raw rows.
+
+    Returns None when they agree, else {"stored": ..., "raw": ...}.
+    """
+    doc = await counters_col.find_one({"_id": ObjectId(class_id)})
+    raw_total, raw_attended = await raw_attendance_counts(class_id)
+    stored = None
+    if doc is not None:
+        stored = {"sessions": doc.get("sessions"), "present": {k: v for k, v in (doc.get("present") or {}).items() if v}}
+    raw = {"sessions": raw_total, "present": {k: v for k, v in raw_attended.items() if v}}
+    return None if stored == raw else {"stored": stored, "raw": raw}
+
+
+async def init_counters(class_id):
+    """Empty counters for a new classroom."""
+    try:
+        await counters_col.insert_one({"_id": ObjectId(class_id), **counters_doc()})
+    except DuplicateKeyError:
+        pass
+
+
+async def class_attendance_counts(class_id, student_ids=None):
+    """Return (total, {student_id_str: attended}) for a classroom.
+
+    total is the number of classes taken (sessions of the class).
+    student_ids limits the returned map (and the bytes read) to those students.
+    """
+    projection = None
+    if student_ids is not None:
+        projection = {"sessions": 1}
+        projection.update({f"present.{sid}": 1 for sid in map(str, student_ids)})
+    doc = await counters_col.find_one({"_id": ObjectId(class_id)}, projection)
+    if doc is None:
+        total, attended = await rebuild_counters(class_id)
+    else:
+        total, attended = doc["sessions"], doc.get("present") or {}
+    if student_ids is not None:
+        attended = {sid: attended[sid] for sid in map(str, student_ids) if sid in attended}
+    return total, attended
+
+
+async def attendance_deltas(classroom, student_ids):
+    """(classes taken, {student_id: {attended, percentage, eligible}}) of a few
+    students -- the summary rows a live "attendance" event patches."""
+    total, attended = await class_attendance_counts(classroom["_id"], student_ids)
+    min_att = classroom.get("minAttendance") or 0
+    rows = {}
+    for sid in map(str, student_ids):
+        pct = percent(attended.get(sid, 0), total)
+        rows[sid] = {"attended": attended.get(sid, 0), "percentage": pct, "eligible": pct >= min_att}
+    return total, rows
+
+
+async def fetch_students(student_ids, projection=None):
+    """Batched user lookup -> {student_id_str: user_doc}."""
+    obj_ids = to_object_ids(student_ids)
+    if not obj_ids:
+        return {}
+    projection = projection or STUDENT_ROW_PROJECTION
+    cursor = users_col.find({"_id": {"$in": obj_ids}}, projection)
+    return {str(u["_id"]): u async for u in cursor}
+
+
+async def class_attendance_summary(classroom, student_ids=None):
+    """Per-student attendance rows of a classroom, in roster order.
+
+    student_ids restricts the rows (e.g. only the logged in student);
+    students whose user document is gone are skipped.
+    """
+    class_id = classroom["_id"]
+    if student_ids is None:
+        student_ids = classroom.get("students", [])
+    student_ids = [str(s) for s in student_ids]
+
+    total, attended = await class_attendance_counts(class_id)
+    students = await fetch_students(student_ids)
+    min_att = classroom.get("minAttendance") or 0
+
+    rows = []
+    for sid in student_ids:
+        stu = students.get(sid)
+        if not stu:
+            continue
+        present = attended.get(sid, 0)
+        pct = percent(present, total)
+        rows.append({
+            "student_id": sid,
+            "usn": stu.get("usn"),
+            "name": stu.get("name"),
+            "total": total,
+            "attended": present,
+            "percentage": pct,
+            "eligible": pct >= min_att,
+        })
+    return rows
+
+
+async def today_attendance(classroom, date):
+    """Roster of a classroom joined with its attendance rows of one date.
+
+    One $in user fetch (name/usn only) + one find over the class attendance
+    of that date, joined in memory. Rows are in roster order, each with the
+    raw attendance "record" (None when the student was not seen).
+    """
+    student_ids = [str(s) for s in classroom.get("students", [])]
+    students = await fetch_students(student_ids)
+
+    cursor = attendance_col.find(
+        {"class_id": ObjectId(classroom["_id"]), "date": date},
+        {"student_id": 1, "present": 1, "timestamp": 1, "createdAt": 1},
+    )
+    records = {str(r["student_id"]): r async for r in cursor}
+
+    rows = []
+    for sid in student_ids:
+        stu = students.get(sid)
+        if not stu:
+            continue
+        rows.append({
+            "student_id": sid,
+            "name": stu.get("name"),
+            "usn": stu.get("usn"),
+            "record": records.get(sid),
+        })
+    return rows
+
+
+async def mark_present(class_id, student_ids, date):
+    """Upsert the (student, class, date) rows of a face session in one
+    unordered bulk_write.
+
+    Idempotent: re-sending the same session only moves updatedAt (latest
+    sighting); createdAt (first sighting, shown as the report timestamp)
+    is written once via $setOnInsert. Rows it inserts are added to the
+    class counters. Returns the ids of the students whose row was new.
+    """
+    if not student_ids:
+        return []
+    student_ids = [str(s) for s in student_ids]
+    class_oid = ObjectId(class_id)
+    now = datetime.utcnow()
+    ops = [
+        UpdateOne(
+            {"student_id": ObjectId(sid), "class_id": class_oid, "date": date},
+            {
+                "$set": {"present": True, "updatedAt": now},
+                "$setOnInsert": {"createdAt": now},
+            },
+            upsert=True,
+        )
+        for sid in student_ids
+    ]
+    try:
+        result = await attendance_col.bulk_write(ops, ordered=False)
+        inserted = [student_ids[i] for i in result.upserted_ids]
+    except BulkWriteError as e:
+        # a concurrent session inserted some of the rows first (unique
+        # index); those rows exist and are present, the rest went through
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+        inserted = [student_ids[u["index"]] for u in e.details.get("upserted", [])]
+
+    if inserted:
+        inc = {f"present.{sid}": 1 for sid in inserted}
+        # no upsert: a class without counters is rebuilt from the rows on read
+        await counters_col.update_one({"_id": class_oid}, {"$inc": inc, "$set": {"updatedAt": now}})
+    return inserted
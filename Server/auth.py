@@ -0,0 +1,155 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import jwt
+from dotenv import load_dotenv
+from fastapi import Header, HTTPException
+
+from db import users_col
+from models import SLIM_USER_PROJECTION
+
+# ---------------------------
+# AUTH (JWT + cached user resolution)
+# ---------------------------
+load_dotenv()
+
+JWT_SECRET = os.getenv("JWT_SECRET", "change_this")
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))       # seconds
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "2048"))
+
+
+def create_token(email: str, expires_hours: int = 8):
+    payload = {"sub": email, "exp": datetime.utcnow() + timedelta(hours=expires_hours)}
+    token = jwt.encode(payload, JWT_SECRET, algorithm="HS256")
+    return token
+
+
+def decode_token(token: str):
+    return jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+
+
+class TTLCache:
+    """Small LRU cache whose entries also expire after ttl seconds."""
+
+    def __init__(self, maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_claims_cache = TTLCache()      # token -> decoded claims
+_user_cache = TTLCache()        # email -> slim user
+
+
+class AuthError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+def verify_token(authorization):
+    """'Bearer <token>' header -> decoded claims (cached until expiry/TTL)."""
+    if not authorization:
+        raise AuthError(401, "Missing Authorization header")
+    try:
+        scheme, token = authorization.split()
+    except ValueError:
+        raise AuthError(401, "Invalid token")
+    if scheme.lower() != "bearer":
+        raise AuthError(401, "Invalid auth scheme")
+
+    claims = _claims_cache.get(token)
+    if claims is not None:
+        return claims
+
+    try:
+        claims = decode_token(token)
+    except Exception:
+        raise AuthError(401, "Invalid token")
+    if not claims.get("sub"):
+        raise AuthError(401, "Invalid token payload")
+
+    # never keep a token cached past its own expiry
+    exp = claims.get("exp")
+    ttl = exp - time.time() if exp else None
+    _claims_cache.set(token, claims, ttl)
+    return claims
+
+
+async def load_user(email):
+    """Slim user document of an email ({_id, name, email, usn}), cached."""
+    user = _user_cache.get(email)
+    if user is not None:
+        return dict(user)
+    user = await users_col.find_one({"email": email}, SLIM_USER_PROJECTION)
+    if user is not None:
+        _user_cache.set(email, dict(user))
+    return user
+
+
+async def authenticate(authorization):
+    """Authorization header -> slim user, raises AuthError."""
+    claims = verify_token(authorization)
+    user = await load_user(claims["sub"])
+    if not user:
+        raise AuthError(404, "User not found")
+    return user
+
+
+def invalidate_user(email):
+    """Call after any write to the user document (join/create/enroll)."""
+    _user_cache.pop(email)
+
+
+def auth_cache_stats():
+    return {
+        "tokens": {"size": len(_claims_cache), "hits": _claims_cache.hits, "misses": _claims_cache.misses},
+        "users": {"size": len(_user_cache), "hits": _user_cache.hits, "misses": _user_cache.misses},
+    }
+
+
+# ---------- FastAPI dependencies ----------
+async def current_user(authorization: str = Header(None)):
+    try:
+        return await authenticate(authorization)
+    except AuthError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+
+
+async def current_claims(authorization: str = Header(None)):
+    try:
+        return verify_token(authorization)
+    except AuthError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
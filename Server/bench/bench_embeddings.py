@@ -0,0 +1,71 @@
+"""Stored bytes per user + class gallery build time, list vs packed embeddings.
+
+Offline: BSON encodes/decodes synthetic user documents in each storage
+format and builds a ClassGallery from the decoded documents:
+
+    python bench/bench_embeddings.py --students 300 --samples 5
+"""
+import argparse
+import os
+import sys
+import time
+
+import bson
+import numpy as np
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embeddings import pack_embeddings  # noqa: E402
+from face_service import ClassGallery  # noqa: E402
+
+FORMATS = {
+    "list (legacy)": lambda arr: arr.tolist(),
+    "packed float32": lambda arr: pack_embeddings(arr, dtype="float32"),
+    "packed float16": lambda arr: pack_embeddings(arr, dtype="float16"),
+}
+
+
+def make_docs(students, samples, encode):
+    rng = np.random.default_rng(0)
+    docs = []
+    for i in range(students):
+        arr = rng.normal(0, 0.1, (samples, 128))
+        docs.append({
+            "_id": ObjectId(),
+            "name": f"Student {i}",
+            "usn": f"1XX21CS{i:03}",
+            "face_id": {"embeddings": encode(arr)},
+        })
+    return docs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=300)
+    parser.add_argument("--samples", type=int, default=5, help="embeddings per user")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    print(f"{args.students} students x {args.samples} embeddings\n")
+    print(f"{'format':16} {'bytes/user':>10} {'decode ms':>10} {'gallery ms':>11}")
+    for name, encode in FORMATS.items():
+        raw = [bson.encode(d) for d in make_docs(args.students, args.samples, encode)]
+        per_user = sum(len(r) for r in raw) / len(raw)
+
+        decode_s = build_s = 0.0
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            docs = [bson.decode(r) for r in raw]
+            decode_s += time.perf_counter() - started
+
+            started = time.perf_counter()
+            ClassGallery("bench").set_students(docs)
+            build_s += time.perf_counter() - started
+
+        print(f"{name:16} {per_user:>10.0f} {decode_s / args.repeat * 1000:>10.2f} "
+              f"{build_s / args.repeat * 1000:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
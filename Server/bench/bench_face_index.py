@@ -0,0 +1,53 @@
+"""Recall and latency of the IVF face index against brute force.
+
+Synthetic identities: one centre per user (inter-user distance ~0.95,
+like dlib embeddings) and a few noisy samples per user (~0.3 apart):
+
+    python bench/bench_face_index.py --users 20000 --samples 3
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from face_index import FaceIndex  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--samples", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(1)
+    centres = rng.normal(0, 0.06, (args.users, 128)).astype(np.float32)
+    items = [(f"u{i}", centres[i] + rng.normal(0, 0.02, (args.samples, 128))) for i in range(args.users)]
+
+    started = time.perf_counter()
+    index = FaceIndex().build(items)
+    cells = 0 if index.centroids is None else len(index.centroids)
+    print(f"build: {index.rows} vectors, {cells} cells, {time.perf_counter() - started:.2f} s")
+
+    queries = centres[rng.choice(args.users, args.queries)] + rng.normal(0, 0.02, (args.queries, 128))
+
+    started = time.perf_counter()
+    index.search(queries, k=1, exact=True)
+    exact_ms = (time.perf_counter() - started) / args.queries * 1000
+    print(f"brute force: {exact_ms:.2f} ms/query")
+
+    for nprobe in args.nprobe:
+        started = time.perf_counter()
+        index.search(queries, k=1, nprobe=nprobe)
+        ivf_ms = (time.perf_counter() - started) / args.queries * 1000
+        recall = index.recall(queries, k=1, nprobe=nprobe)
+        print(f"nprobe={nprobe:<3} recall@1={recall:.4f}  {ivf_ms:.2f} ms/query  ({exact_ms / ivf_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
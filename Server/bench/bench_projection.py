@@ -0,0 +1,105 @@
+"""Bytes on the wire + BSON decode time per endpoint, before/after projections.
+
+Runs offline on a synthetic user document shaped like the ones
+/save-face-id writes (N enrolled 128-d embeddings):
+
+    python bench/bench_projection.py --samples 5 --repeat 2000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+import bson
+import numpy as np
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import (  # noqa: E402
+    ID_ONLY_PROJECTION,
+    LOGIN_PROJECTION,
+    SLIM_USER_PROJECTION,
+    STUDENT_ROW_PROJECTION,
+    USER_VIEW_PROJECTION,
+)
+
+# endpoint -> (projection before, projection after); None = whole document
+ENDPOINTS = {
+    "/me": ({"password_hash": 0, "password": 0}, USER_VIEW_PROJECTION),
+    "/classes/my": (None, {"joinedClassrooms": 1, "createdClassrooms": 1}),
+    "/class/join": (None, SLIM_USER_PROJECTION),
+    "/class/create": (None, SLIM_USER_PROJECTION),
+    "/class/{id}": (None, SLIM_USER_PROJECTION),
+    "/login": (None, LOGIN_PROJECTION),
+    "/check-user": (None, ID_ONLY_PROJECTION),
+    "report row (per student)": (None, STUDENT_ROW_PROJECTION),
+}
+
+
+def make_user(samples):
+    rng = np.random.default_rng(0)
+    return {
+        "_id": ObjectId(),
+        "name": "Student Name",
+        "email": "student@example.com",
+        "password": "secret",
+        "usn": "1XX21CS001",
+        "face_id": {
+            "embeddings": rng.normal(0, 0.1, (samples, 128)).tolist(),
+            "enrolledAt": datetime.utcnow(),
+        },
+        "joinedClassrooms": [str(ObjectId()) for _ in range(6)],
+        "createdClassrooms": [],
+        "createdAt": datetime.utcnow(),
+    }
+
+
+def apply_projection(doc, projection):
+    """Tiny stand-in for the server side projection (top level + one dot)."""
+    if projection is None:
+        return doc
+    include = any(projection.values())
+    if not include:
+        return {k: v for k, v in doc.items() if k not in projection}
+    out = {"_id": doc["_id"]} if projection.get("_id", 1) else {}
+    for key in projection:
+        if key == "_id":
+            continue
+        head, _, tail = key.partition(".")
+        if head not in doc:
+            continue
+        if tail:
+            out.setdefault(head, {})[tail] = doc[head].get(tail)
+        else:
+            out[head] = doc[head]
+    return out
+
+
+def measure(doc, repeat):
+    raw = bson.encode(doc)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        bson.decode(raw)
+    per_call_us = (time.perf_counter() - started) / repeat * 1e6
+    return len(raw), per_call_us
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--samples", type=int, default=5, help="embeddings per user")
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    user = make_user(args.samples)
+    print(f"user document with {args.samples} embeddings\n")
+    print(f"{'endpoint':28} {'bytes before':>12} {'bytes after':>12} {'decode before':>14} {'decode after':>13}")
+    for name, (before, after) in ENDPOINTS.items():
+        b_bytes, b_us = measure(apply_projection(user, before), args.repeat)
+        a_bytes, a_us = measure(apply_projection(user, after), args.repeat)
+        print(f"{name:28} {b_bytes:>12} {a_bytes:>12} {b_us:>11.1f} us {a_us:>10.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""JSON serialisation time + bytes on the wire for the big payloads.
+
+Offline, synthetic payloads shaped like the real endpoints:
+
+    summary    /class/{id}/attendance/summary rows
+    classroom  /class/{id} (roster of ObjectId strings, notice, datetimes)
+    classes    /classes/my with raw Mongo documents (ObjectId, datetime)
+
+Compares FastAPI's default path (jsonable_encoder + json.dumps), the app's
+default response class behind jsonable_encoder, and FastJSONResponse
+returned directly; then the body size raw / gzip / brotli (if installed):
+
+    python bench/bench_responses.py --students 3000
+"""
+import argparse
+import os
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from responses import FastJSONResponse, RESPONSE_GZIP_LEVEL, RESPONSE_BROTLI_QUALITY, brotli, orjson  # noqa: E402
+
+
+def _classroom(i, students):
+    return {
+        "_id": ObjectId(),
+        "subjectName": f"Subject {i}", "teacherName": "Teacher", "department": "CSE",
+        "section": "A", "semester": 5, "minAttendance": 75, "collegeName": "College",
+        "courseCode": f"CS{i:03}", "classCode": f"code{i:04}", "createdBy": str(ObjectId()),
+        "students": students,
+        "createdAt": datetime(2025, 1, 1) + timedelta(minutes=i),
+        "notice": {"notice": "Lab moved to room 204", "publishedAt": datetime(2025, 2, 1, 9, 30, 0, 123000),
+                   "publishedBy": str(ObjectId()), "publishedByName": "Teacher"},
+        "rev": 3,
+    }
+
+
+def payloads(students):
+    roster = [str(ObjectId()) for _ in range(students)]
+    summary = [
+        {"usn": f"1XX21CS{i:04}", "name": f"Student Name {i}", "percentage": 60 + i % 40, "eligible": i % 40 >= 15}
+        for i in range(students)
+    ]
+    return {
+        "summary": {"success": True, "summary": summary},
+        "classroom": {"success": True, "classroom": _classroom(0, roster),
+                      "attendance": {"percentage": 81, "present_days": 30, "total_days": 37}},
+        "classes": {"success": True, "joined": [_classroom(i, []) for i in range(8)],
+                    "created": [_classroom(i, []) for i in range(8, 40)]},
+    }
+
+
+def fastapi_default(content):
+    # what the handlers paid before: jsonable_encoder + JSONResponse
+    content = jsonable_encoder(content, custom_encoder={ObjectId: str})
+    return JSONResponse(content).body
+
+
+def encoder_then_fast(content):
+    # a dict returned by a handler: jsonable_encoder + default_response_class
+    content = jsonable_encoder(content, custom_encoder={ObjectId: str})
+    return FastJSONResponse(content).body
+
+
+def fast_direct(content):
+    # handler returns FastJSONResponse itself
+    return FastJSONResponse(content).body
+
+
+PATHS = {
+    "jsonable+json": fastapi_default,
+    "jsonable+fast": encoder_then_fast,
+    "fast direct": fast_direct,
+}
+
+
+def timed(fn, content, repeat):
+    fn(content)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        body = fn(content)
+    return (time.perf_counter() - started) / repeat * 1000, body
+
+
+def gzip_size(body):
+    compressor = zlib.compressobj(RESPONSE_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return len(compressor.compress(body) + compressor.flush())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    print(f"orjson: {'yes' if orjson else 'no (stdlib fallback)'}, brotli: {'yes' if brotli else 'no'}\n")
+    print(f"{'payload':10} " + " ".join(f"{name:>14}" for name in PATHS) + "   (ms per response)")
+    bodies = {}
+    for name, content in payloads(args.students).items():
+        row = []
+        for fn in PATHS.values():
+            ms, body = timed(fn, content, args.repeat)
+            row.append(f"{ms:>14.3f}")
+        bodies[name] = body
+        print(f"{name:10} " + " ".join(row))
+
+    print(f"\n{'payload':10} {'raw B':>10} {'gzip B':>10} {'br B':>10}")
+    for name, body in bodies.items():
+        br = len(brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)) if brotli else None
+        print(f"{name:10} {len(body):>10} {gzip_size(body):>10} {br if br is not None else '-':>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Boot time and memory of one worker per WORKER_ROLE.
+
+Each role runs in a fresh interpreter: import main, run the app startup
+(lifespan), optionally encode one photo (--warm, vision roles only), and
+report the time taken plus the RSS of the worker and of its encoder
+processes:
+
+    python bench/bench_startup.py                       # in-memory stand-in DB
+    python bench/bench_startup.py --mongo-uri mongodb://localhost:27017 --warm
+
+Linux only for the child-process RSS (reads /proc).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVER = os.path.dirname(HERE)
+
+HEAVY_MODULES = ("face_recognition", "dlib", "cv2", "PIL")
+
+# runs inside the measured interpreter
+PROBE = r"""
+import asyncio, json, os, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {server!r})
+if not {mongo_uri!r}:
+    sys.path.insert(0, {here!r})
+    import standin
+    standin.install()
+import_started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+def rss_kb(pid="self"):
+    try:
+        with open(f"/proc/{{pid}}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return 0
+    return 0
+
+def children():
+    out = []
+    try:
+        for tid in os.listdir("/proc/self/task"):
+            with open(f"/proc/self/task/{{tid}}/children") as f:
+                out += f.read().split()
+    except OSError:
+        pass
+    return out
+
+async def run():
+    after_import = rss_kb()
+    async with main.lifespan(main.app):
+        booted = time.perf_counter()
+        after_boot = rss_kb()
+        warm_ms = None
+        if {warm!r} and main.VISION_ENABLED:
+            import io
+            import numpy as np
+            from PIL import Image
+            buf = io.BytesIO()
+            Image.fromarray(np.zeros((480, 640, 3), dtype=np.uint8)).save(buf, "JPEG")
+            t = time.perf_counter()
+            await main.encoder.encode(buf.getvalue())
+            warm_ms = round((time.perf_counter() - t) * 1000, 1)
+        kids = children()
+        return {{
+            "import_s": round(imported - import_started, 3),
+            "boot_s": round(booted - imported, 3),
+            "total_s": round(booted - started, 3),
+            "rss_import_mb": round(after_import / 1024, 1),
+            "rss_boot_mb": round(after_boot / 1024, 1),
+            "rss_now_mb": round(rss_kb() / 1024, 1),
+            "encoder_procs": len(kids),
+            "encoder_rss_mb": round(sum(rss_kb(pid) for pid in kids) / 1024, 1),
+            "first_encode_ms": warm_ms,
+            "heavy_loaded": [m for m in {heavy!r} if m in sys.modules],
+        }}
+
+print("RESULT " + json.dumps(asyncio.run(run())))
+"""
+
+
+def measure(role, args):
+    env = dict(os.environ, WORKER_ROLE=role)
+    if args.mongo_uri:
+        env["MONGO_URI"] = args.mongo_uri
+        env.setdefault("DB_NAME", "ClassRoom_bench")
+    code = PROBE.format(server=SERVER, here=HERE, mongo_uri=args.mongo_uri or "",
+                        warm=args.warm, heavy=HEAVY_MODULES)
+    proc = subprocess.run([sys.executable, "-c", code], env=env, cwd=SERVER,
+                          capture_output=True, text=True, timeout=args.timeout)
+    for line in proc.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError(f"{role} worker failed:\n{proc.stderr[-2000:]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--roles", nargs="+", default=["api", "all"])
+    parser.add_argument("--warm", action="store_true", help="encode one photo (loads dlib in the pool)")
+    parser.add_argument("--mongo-uri", default=None, help="real server instead of the stand-in")
+    parser.add_argument("--timeout", type=int, default=300)
+    args = parser.parse_args(argv)
+
+    print(f"{'role':8} {'import s':>9} {'boot s':>8} {'RSS MB':>8} {'pool procs':>11} {'pool MB':>8} "
+          f"{'1st enc ms':>11}  heavy modules in worker")
+    for role in args.roles:
+        r = measure(role, args)
+        print(f"{role:8} {r['import_s']:>9.3f} {r['boot_s']:>8.3f} {r['rss_now_mb']:>8.1f} "
+              f"{r['encoder_procs']:>11} {r['encoder_rss_mb']:>8.1f} {r['first_encode_ms'] or '-':>11}  "
+              f"{', '.join(r['heavy_loaded']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
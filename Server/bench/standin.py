@@ -0,0 +1,194 @@
+"""In-memory stand-in for pymongo.AsyncMongoClient (benchmarks only).
+
+Wraps mongomock behind the async API the app uses (awaitable collection
+methods, async cursors, awaitable aggregate), so the real db / attendance /
+reports code runs unchanged without a mongod:
+
+    import standin
+    standin.install()      # before anything imports db
+    import db
+
+Only the calls the app makes are covered. Timings are for the Python side
+(driver work + our code); there is no network and no index, so use
+--mongo-uri against a real server for numbers involving the database.
+"""
+import asyncio
+import os
+import time
+
+import mongomock
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+
+class _Cursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._it = None
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, n):
+        self._cursor = self._cursor.limit(n)
+        return self
+
+    def skip(self, n):
+        self._cursor = self._cursor.skip(n)
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    async def to_list(self, length=None):
+        out = list(self._cursor)
+        return out if length is None else out[:length]
+
+    def __aiter__(self):
+        self._it = iter(self._cursor)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def explain(self):
+        return {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}
+
+    async def close(self):
+        pass
+
+
+class _TailCursor:
+    """Tailable-await cursor (live bus), emulated by polling the collection."""
+
+    def __init__(self, col, filter, max_await_time_ms=1000):
+        self._col = col
+        self._filter = filter
+        self._wait = max_await_time_ms / 1000
+        self._returned = set()
+        self.alive = True
+
+    async def next(self):
+        deadline = time.monotonic() + self._wait
+        while True:
+            for doc in self._col.find(self._filter):
+                if doc["_id"] not in self._returned:
+                    self._returned.add(doc["_id"])
+                    return doc
+            if time.monotonic() >= deadline:
+                raise StopAsyncIteration
+            await asyncio.sleep(0.01)
+
+
+class _BulkResult:
+    def __init__(self, upserted_ids, modified_count):
+        self.upserted_ids = upserted_ids
+        self.upserted_count = len(upserted_ids)
+        self.modified_count = modified_count
+
+
+class _Collection:
+    def __init__(self, col):
+        self._col = col
+        self.name = col.name
+
+    def find(self, *args, **kwargs):
+        kwargs.pop("batch_size", None)
+        if kwargs.pop("cursor_type", None) == CursorType.TAILABLE_AWAIT:
+            return _TailCursor(self._col, *args, **kwargs)
+        return _Cursor(self._col.find(*args, **kwargs))
+
+    async def find_one(self, filter=None, *args, sort=None, **kwargs):
+        if sort == [("$natural", -1)]:
+            # newest first = reverse insertion order
+            docs = list(self._col.find(filter, *args, **kwargs))
+            return docs[-1] if docs else None
+        return self._col.find_one(filter, *args, sort=sort, **kwargs)
+
+    async def options(self):
+        return {"capped": True} if self.name in _CAPPED else {}
+
+    async def aggregate(self, pipeline, **kwargs):
+        return _Cursor(iter(list(self._col.aggregate(pipeline))))
+
+    async def bulk_write(self, requests, ordered=True, **kwargs):
+        # mongomock's bulk API lags behind pymongo's operation objects
+        upserted, modified = {}, 0
+        for i, op in enumerate(requests):
+            kind = type(op).__name__
+            if kind == "UpdateOne":
+                res = self._col.update_one(op._filter, op._doc, upsert=op._upsert)
+            elif kind == "UpdateMany":
+                res = self._col.update_many(op._filter, op._doc, upsert=op._upsert)
+            elif kind == "ReplaceOne":
+                res = self._col.replace_one(op._filter, op._doc, upsert=op._upsert)
+            elif kind == "InsertOne":
+                self._col.insert_one(op._doc)
+                continue
+            else:
+                raise NotImplementedError(kind)
+            if res.upserted_id is not None:
+                upserted[i] = res.upserted_id
+            modified += res.modified_count
+        return _BulkResult(upserted, modified)
+
+    def __getattr__(self, name):
+        method = getattr(self._col, name)
+
+        async def call(*args, **kwargs):
+            kwargs.pop("session", None)
+            return method(*args, **kwargs)
+        return call
+
+
+_CAPPED = set()      # collections created as capped (mongomock ignores the option)
+
+
+class _Database:
+    def __init__(self, database):
+        self._db = database
+
+    async def create_collection(self, name, capped=False, **kwargs):
+        if name in self._db.list_collection_names():
+            raise CollectionInvalid(f"collection {name} already exists")
+        self._db.create_collection(name)
+        if capped:
+            _CAPPED.add(name)
+        return _Collection(self._db[name])
+
+    def __getitem__(self, name):
+        return _Collection(self._db[name])
+
+    def __getattr__(self, name):
+        return _Collection(self._db[name])
+
+    async def command(self, *args, **kwargs):
+        return {"ok": 1}
+
+
+class AsyncMongoClient:
+    _shared = None
+
+    def __init__(self, *args, **kwargs):
+        # one in-memory server per process, like a real deployment
+        if AsyncMongoClient._shared is None:
+            AsyncMongoClient._shared = mongomock.MongoClient()
+        self._client = AsyncMongoClient._shared
+
+    def __getitem__(self, name):
+        return _Database(self._client[name])
+
+    async def close(self):
+        pass
+
+
+def install():
+    """Make `import db` connect to the in-memory stand-in."""
+    import pymongo
+
+    os.environ.setdefault("MONGO_URI", "mongodb://standin")
+    pymongo.AsyncMongoClient = AsyncMongoClient
@@ -0,0 +1,302 @@
+"""Hot-path benchmark suite: face matching, summaries and CSV reports.
+
+Seeds a synthetic campus (students with packed 128-d embeddings, a
+classroom, an attendance history) and times the real code paths at every
+(class size, history rows) combination:
+
+    gallery_build   ClassGallery.set_students over the fetched documents
+    gallery_load    cold GalleryCache.get (student fetch + build)
+    match           gallery.match for one photo (up to 150 faces)
+    session_write   open_session + mark_present + record_present (--mongo-uri
+                    only: the stand-in has no indexes, every upsert is a scan)
+    summary         class_attendance_summary (/attendance/summary)
+    report_summary  summary CSV, fully streamed
+    report_today    today's roster CSV, fully streamed
+
+Runs offline against an in-memory Mongo stand-in (bench/standin.py, needs
+mongomock); --mongo-uri runs against a real server instead (use a scratch
+database -- it is dropped first), which is what the 1M-10M row histories
+need:
+
+    python bench/suite.py --sizes 30 300 3000 --history 1000 100000 --out base.json
+    python bench/suite.py --out new.json --compare base.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+PHOTO_FACES = 150       # most faces one classroom photo realistically holds
+PRESENT_RATE = 0.85
+# cases that only mean something with real indexes behind them
+DB_ONLY_CASES = {"session_write"}
+
+
+def _percentiles(samples_ms):
+    arr = np.asarray(samples_ms)
+    return {
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+        "mean_ms": round(float(arr.mean()), 3),
+    }
+
+
+async def measure(fn, repeat, warmup=1):
+    """Timed runs (no tracing) + one traced run for the peak Python heap."""
+    for _ in range(warmup):
+        await fn()
+    samples = []
+    started_all = time.perf_counter()
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    wall = time.perf_counter() - started_all
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    await fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    out = _percentiles(samples)
+    out["ops_per_s"] = round(repeat / wall, 2) if wall else None
+    out["peak_kb"] = round(peak / 1024, 1)
+    out["repeat"] = repeat
+    return out
+
+
+# ---------- synthetic data ----------
+async def seed(n_students, history, samples, rng):
+    from bson import ObjectId
+    from db import users_col, classrooms_col, attendance_col, sessions_col, counters_col
+    from embeddings import pack_embeddings
+    from attendance import rebuild_counters
+    from sessions import pack_present
+
+    for col in (users_col, classrooms_col, attendance_col, sessions_col, counters_col):
+        await col.delete_many({})
+
+    centres = rng.normal(0, 0.06, (n_students, 128)).astype(np.float32)
+    student_ids = [ObjectId() for _ in range(n_students)]
+    users = []
+    for i, sid in enumerate(student_ids):
+        embs = centres[i] + rng.normal(0, 0.02, (samples, 128))
+        users.append({
+            "_id": sid,
+            "name": f"Student {i}",
+            "email": f"s{i}@bench",
+            "usn": f"1BN21CS{i:04}",
+            "face_id": {"embeddings": pack_embeddings(embs), "enrolledAt": datetime.utcnow()},
+            "joinedClassrooms": [],
+        })
+    await users_col.insert_many(users)
+
+    class_id = ObjectId()
+    roster = [str(s) for s in student_ids]
+    classroom = {
+        "_id": class_id, "subjectName": "Bench", "teacherName": "T", "department": "CS",
+        "section": "A", "semester": 5, "minAttendance": 75, "collegeName": "C",
+        "courseCode": "B1", "classCode": "bench001", "createdBy": "t", "students": roster,
+    }
+    await classrooms_col.insert_one(classroom)
+
+    # `history` attendance rows spread over the days up to today
+    days = max(1, history // max(1, int(n_students * PRESENT_RATE)))
+    first = date.today() - timedelta(days=days - 1)
+    written, batch, sessions = 0, [], []
+    for d in range(days):
+        day = (first + timedelta(days=d)).isoformat()
+        present = rng.random(n_students) < PRESENT_RATE
+        ids = [roster[i] for i in np.flatnonzero(present)]
+        for sid in ids:
+            if written >= history:
+                break
+            batch.append({"student_id": ObjectId(sid), "class_id": class_id, "date": day,
+                          "present": True, "createdAt": datetime.utcnow()})
+            written += 1
+        sessions.append({"class_id": class_id, "date": day, "roster": roster,
+                         "present": pack_present(roster, ids), "presentCount": len(ids),
+                         "startedAt": datetime.utcnow(), "finalizedAt": datetime.utcnow()})
+        if len(batch) >= 50000:
+            await attendance_col.insert_many(batch)
+            batch = []
+    if batch:
+        await attendance_col.insert_many(batch)
+    await sessions_col.insert_many(sessions)
+    await rebuild_counters(class_id)
+    return classroom, centres
+
+
+def photo(centres, rng, n_faces):
+    """Noisy encodings of random students + a few strangers."""
+    n_faces = min(n_faces, len(centres))
+    picked = rng.choice(len(centres), n_faces, replace=False)
+    faces = centres[picked] + rng.normal(0, 0.02, (n_faces, 128))
+    strangers = rng.normal(0, 0.06, (max(1, n_faces // 20), 128))
+    return np.vstack([faces, strangers]).astype(np.float32)
+
+
+# ---------- cases ----------
+async def run_case_set(n_students, history, args, rng):
+    from bson import ObjectId
+    from db import users_col, sessions_col
+    from attendance import class_attendance_summary, mark_present
+    from face_service import ClassGallery, GalleryCache
+    from reports import report_header, stream_csv, summary_batches, roster_day_batches
+    from sessions import open_session, record_present
+
+    classroom, centres = await seed(n_students, history, args.samples, rng)
+    class_id = str(classroom["_id"])
+    today = date.today().isoformat()
+    repeat = max(3, args.repeat // max(1, n_students // 300))
+
+    docs = await users_col.find(
+        {"_id": {"$in": [ObjectId(s) for s in classroom["students"]]}},
+        {"name": 1, "usn": 1, "face_id.embeddings": 1},
+    ).to_list(None)
+    gallery = ClassGallery(class_id)
+    gallery.set_students(docs)
+    frame = photo(centres, rng, PHOTO_FACES)
+    present = [m["student_id"] for m in gallery.match(frame)]
+
+    async def gallery_build():
+        ClassGallery(class_id).set_students(docs)
+
+    async def gallery_load():
+        await GalleryCache(users_col).get(classroom)
+
+    async def match():
+        gallery.match(frame)
+
+    async def session_write():
+        await sessions_col.delete_many({"class_id": classroom["_id"], "date": "2999-01-01"})
+        session = await open_session(classroom, "2999-01-01")
+        await mark_present(class_id, present, "2999-01-01")
+        await record_present(session, present)
+
+    async def summary():
+        await class_attendance_summary(classroom)
+
+    async def _drain(body):
+        size = 0
+        async for chunk in body:
+            size += len(chunk)
+        return size
+
+    async def report_summary():
+        header = report_header(classroom, "Full Attendance Report", ["Sl.No", "USN", "Name", "T", "A", "P"])
+        await _drain(stream_csv(header, summary_batches(classroom)))
+
+    async def report_today():
+        header = report_header(classroom, "Today's Attendance", ["Sl.No", "USN", "Name", "Status", "Seen At"])
+        await _drain(stream_csv(header, roster_day_batches(classroom, today)))
+
+    cases = {
+        "gallery_build": gallery_build,
+        "gallery_load": gallery_load,
+        "match": match,
+        "session_write": session_write,
+        "summary": summary,
+        "report_summary": report_summary,
+        "report_today": report_today,
+    }
+    results = []
+    for name, fn in cases.items():
+        if args.cases and name not in args.cases:
+            continue
+        if name in DB_ONLY_CASES and not args.mongo_uri:
+            continue
+        row = {"case": name, "students": n_students, "history": history}
+        row.update(await measure(fn, repeat))
+        results.append(row)
+        print(f"{name:15} {n_students:>6} {history:>9}  p50 {row['p50_ms']:>9.2f} ms  "
+              f"p95 {row['p95_ms']:>9.2f} ms  {row['ops_per_s'] or 0:>9.1f}/s  peak {row['peak_kb']:>9.0f} KB",
+              flush=True)
+    return results
+
+
+def _meta(args):
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True).strip()
+    except Exception:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "backend": args.mongo_uri and "mongodb" or "standin",
+        "samples": args.samples,
+        "at": datetime.utcnow().isoformat(timespec="seconds"),
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        base = {(r["case"], r["students"], r["history"]): r for r in json.load(f)["results"]}
+    print(f"\nvs {baseline_path} (p50, <1 = faster)")
+    for r in results:
+        old = base.get((r["case"], r["students"], r["history"]))
+        if not old or not old["p50_ms"]:
+            continue
+        ratio = r["p50_ms"] / old["p50_ms"]
+        flag = "  REGRESSION" if ratio > 1.2 else ""
+        print(f"{r['case']:15} {r['students']:>6} {r['history']:>9}  {old['p50_ms']:>9.2f} -> {r['p50_ms']:>9.2f} ms  x{ratio:.2f}{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[30, 300, 3000])
+    parser.add_argument("--history", type=int, nargs="+", default=[1000, 100000],
+                        help="attendance rows per class (1M+ wants --mongo-uri)")
+    parser.add_argument("--samples", type=int, default=3, help="embeddings per student")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--cases", nargs="*", default=None)
+    parser.add_argument("--mongo-uri", default=None, help="real server instead of the stand-in")
+    parser.add_argument("--out", default=None, help="write the results as JSON")
+    parser.add_argument("--compare", default=None, help="baseline JSON to compare against")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+        os.environ.setdefault("DB_NAME", "ClassRoom_bench")
+    else:
+        sys.path.insert(0, HERE)
+        import standin
+        standin.install()
+
+    async def _run():
+        rng = np.random.default_rng(args.seed)
+        results = []
+        for n_students in args.sizes:
+            for history in args.history:
+                results += await run_case_set(n_students, history, args, rng)
+        return results
+
+    if not args.mongo_uri:
+        print("in-memory stand-in: skipping", ", ".join(sorted(DB_ONLY_CASES)), "(use --mongo-uri)")
+    results = asyncio.run(_run())
+    report = {"meta": _meta(args), "results": results}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print("wrote", args.out)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+from pymongo import AsyncMongoClient, IndexModel, ASCENDING
+from pymongo.errors import PyMongoError
+from bson import ObjectId
+from datetime import datetime
+from dotenv import load_dotenv
+import os
+
+from tracing import mongo_listeners
+
+# ---------------------------
+# ENV + DB SETUP
+# ---------------------------
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI")
+DB_NAME = os.getenv("DB_NAME", "ClassRoom_DB")
+
+if not MONGO_URI:
+    raise RuntimeError("MONGO_URI not found in .env")
+
+# connection pool + timeouts (tune per deployment). The async client never
+# blocks the event loop; maxPoolSize bounds the concurrent round trips and
+# waitQueueTimeoutMS how long a request may wait for a free connection.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+
+# all the name of colections of DB
+client = AsyncMongoClient(
+    MONGO_URI,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    # per-request Mongo op counting (TRACING_ENABLED=1)
+    event_listeners=mongo_listeners(),
+)
+db = client[DB_NAME]
+users_col = db["users"]
+classrooms_col = db["classrooms"]
+# Attendance sesstion data
+attendance_col = db["attendance"]
+# materialized per-class attendance counters (see attendance.py)
+counters_col = db["attendance_counters"]
+# one document per class meeting (see sessions.py)
+sessions_col = db["sessions"]
+
+
+# ---------------------------
+# INDEXES
+# ---------------------------
+# every hot query shape must be served by one of these. The unique
+# (class_id, student_id, date) index also makes the face-session upsert
+# race-safe: two concurrent upserts can no longer create two rows.
+INDEXES = {
+    "attendance": [
+        IndexModel([("class_id", ASCENDING), ("student_id", ASCENDING), ("date", ASCENDING)],
+                   name="class_student_date", unique=True),
+        IndexModel([("class_id", ASCENDING), ("date", ASCENDING)], name="class_date"),
+    ],
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        # face index catch-up: users enrolled after a watermark
+        IndexModel([("face_id.enrolledAt", ASCENDING)], name="face_enrolledAt"),
+    ],
+    "classrooms": [
+        IndexModel([("classCode", ASCENDING)], name="classCode_unique", unique=True),
+    ],
+    "sessions": [
+        IndexModel([("class_id", ASCENDING), ("date", ASCENDING)], name="class_date_unique", unique=True),
+    ],
+}
+
+
+async def ensure_indexes():
+    """Create the declared indexes (no-op when they already exist).
+
+    A failing index (e.g. duplicates blocking a unique one) is reported
+    and skipped so the app still starts.
+    """
+    created = []
+    for col_name, models in INDEXES.items():
+        for model in models:
+            try:
+                created += await db[col_name].create_indexes([model])
+            except PyMongoError as e:
+                print(f"WARN index {col_name}.{model.document['name']} not created:", e)
+    return created
+
+
+# query shapes used by the routes; audit_indexes() explains each of them
+_SAMPLE_ID = ObjectId("000000000000000000000000")
+QUERY_SHAPES = [
+    ("attendance by class", "attendance", {"class_id": _SAMPLE_ID}),
+    ("attendance by class+student", "attendance",
+     {"class_id": _SAMPLE_ID, "student_id": _SAMPLE_ID, "present": True}),
+    ("attendance by class+date", "attendance", {"class_id": _SAMPLE_ID, "date": "1970-01-01"}),
+    ("attendance upsert key", "attendance",
+     {"student_id": _SAMPLE_ID, "class_id": _SAMPLE_ID, "date": "1970-01-01"}),
+    ("user by email", "users", {"email": "audit@example.com"}),
+    ("user by id", "users", {"_id": _SAMPLE_ID}),
+    ("users enrolled since", "users", {"face_id.enrolledAt": {"$gt": datetime(1970, 1, 1)}}),
+    ("classroom by code", "classrooms", {"classCode": "audit000"}),
+    ("classroom by id", "classrooms", {"_id": _SAMPLE_ID}),
+    ("session by class+date", "sessions", {"class_id": _SAMPLE_ID, "date": "1970-01-01"}),
+    ("open sessions of class", "sessions",
+     {"class_id": _SAMPLE_ID, "date": {"$lt": "1970-01-01"}, "finalizedAt": None}),
+]
+
+
+def _plan_stages(plan):
+    """Flatten the stage names of an explain() winning plan."""
+    plan = plan.get("queryPlan", plan)   # SBE explain output nests the plan
+    stages = []
+    while plan:
+        stage = plan.get("stage", "?")
+        if plan.get("indexName"):
+            stage += f"({plan['indexName']})"
+        stages.append(stage)
+        for child in plan.get("inputStages") or []:
+            stages += _plan_stages(child)
+        plan = plan.get("inputStage")
+    return stages
+
+
+async def audit_indexes():
+    """explain() every registered query shape and flag COLLSCANs."""
+    report = []
+    for name, col_name, query in QUERY_SHAPES:
+        explained = await db[col_name].find(query).explain()
+        winning = explained.get("queryPlanner", {}).get("winningPlan", {})
+        stages = _plan_stages(winning)
+        report.append({
+            "query": name,
+            "collection": col_name,
+            "filter": sorted(query.keys()),
+            "plan": stages,
+            "collscan": any(s.startswith("COLLSCAN") for s in stages),
+        })
+    return report
@@ -0,0 +1,65 @@
+import os
+import struct
+
+import numpy as np
+from bson import Binary
+
+# ---------------------------
+# packed face embedding storage
+# ---------------------------
+# face_id.embeddings used to be a BSON array of arrays of doubles (every
+# float is a tagged element with its own index key, ~14 bytes each) and had
+# to be rebuilt with np.array() on every gallery load. New enrollments are
+# stored as one binary blob:
+#
+#   header  <BBHH2x   version, dtype code, dim, count   (8 bytes)
+#   body    count x dim little-endian float32 / float16, row major
+#
+# unpack_embeddings() reads both the blob and the legacy list format, so
+# documents can be migrated lazily (`manage.py embeddings migrate`).
+
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<BBHH2x")
+_DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<f2")}
+_CODES = {"float32": 1, "float16": 2}
+
+# float16 halves the size again; distances move by ~1e-3, far below the
+# 0.45 match tolerance
+EMBEDDING_STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "float32")
+
+
+def pack_embeddings(vectors, dtype=None):
+    """(n, dim) vectors -> versioned Binary blob."""
+    code = _CODES.get(dtype or EMBEDDING_STORE_DTYPE)
+    if code is None:
+        raise ValueError(f"dtype must be one of {', '.join(_CODES)}")
+    arr = np.asarray(vectors, dtype=_DTYPES[code])
+    if arr.ndim == 1:
+        arr = arr.reshape(1, -1)
+    header = _HEADER.pack(FORMAT_VERSION, code, arr.shape[1], arr.shape[0])
+    return Binary(header + np.ascontiguousarray(arr).tobytes())
+
+
+def is_packed(value):
+    return isinstance(value, (bytes, bytearray, memoryview))
+
+
+def unpack_embeddings(value):
+    """Stored embeddings (blob or legacy list) -> float32 (n, dim) array.
+
+    float32 blobs are returned as a read-only view over the BSON bytes (no
+    copy). Returns None for an empty / missing value.
+    """
+    if value is None:
+        return None
+    if is_packed(value):
+        version, code, dim, count = _HEADER.unpack_from(value)
+        if version != FORMAT_VERSION or code not in _DTYPES:
+            raise ValueError(f"unsupported embedding blob (version {version}, dtype {code})")
+        arr = np.frombuffer(value, dtype=_DTYPES[code], count=dim * count, offset=_HEADER.size)
+        arr = arr.reshape(count, dim)
+        return arr if code == 1 else arr.astype(np.float32)
+    if len(value) == 0:
+        return None
+    arr = np.asarray(value, dtype=np.float32)
+    return arr.reshape(1, -1) if arr.ndim == 1 else arr
@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from face_service import EMBEDDING_DIM
+
+# ---------------------------
+# content-addressed encoding cache
+# ---------------------------
+# clients on flaky Wi-Fi resend the very same photo. The result of
+# detection + encoding only depends on the image bytes and the detector
+# settings, so it is cached under sha256(bytes) + options:
+#
+#   memory  LRU bounded by FACE_CACHE_MAX_MB (0 turns the cache off)
+#   disk    optional second tier under FACE_CACHE_DIR (one .npz per image,
+#           bounded by FACE_CACHE_DISK_MAX_MB, oldest files pruned first)
+#
+# Entries hold the float32 encodings, the boxes and the image size/scale --
+# a few KB per photo, never the image itself.
+
+FACE_CACHE_MAX_MB = float(os.getenv("FACE_CACHE_MAX_MB", "64"))
+FACE_CACHE_DIR = os.getenv("FACE_CACHE_DIR", "")
+FACE_CACHE_DISK_MAX_MB = float(os.getenv("FACE_CACHE_DISK_MAX_MB", "1024"))
+
+# bump when encode_image changes its output for the same input
+CACHE_VERSION = 1
+
+# hash big uploads off the event loop
+_THREAD_HASH_BYTES = 256 * 1024
+_ENTRY_OVERHEAD = 512       # dict / tuple / key bookkeeping per entry, roughly
+_PRUNE_EVERY = 256          # disk writes between size checks
+
+
+def cache_key(image_bytes, options):
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    return f"{digest}-{options.model}-{options.upsample}-{options.max_side}-v{CACHE_VERSION}"
+
+
+class CachedEncoding:
+    """What is kept per image (see EncodingPool for the EncodeResult built from it)."""
+
+    __slots__ = ("encodings", "boxes", "size", "scale", "nbytes")
+
+    def __init__(self, encodings, boxes, size, scale):
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(len(boxes), EMBEDDING_DIM)
+        encodings.flags.writeable = False      # shared by every hit
+        self.encodings = encodings
+        self.boxes = [tuple(int(v) for v in box) for box in boxes]
+        self.size = tuple(size) if size else None
+        self.scale = scale
+        self.nbytes = encodings.nbytes + 16 * len(self.boxes) + _ENTRY_OVERHEAD
+
+
+class EncodingCache:
+    def __init__(self, max_bytes=FACE_CACHE_MAX_MB * 1024 * 1024, directory=FACE_CACHE_DIR,
+                 disk_max_bytes=FACE_CACHE_DISK_MAX_MB * 1024 * 1024):
+        self.max_bytes = int(max_bytes)
+        self.directory = directory or None
+        self.disk_max_bytes = int(disk_max_bytes)
+        self._entries = OrderedDict()       # key -> CachedEncoding, oldest first
+        self._bytes = 0
+        self._writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    async def key(self, image_bytes, options):
+        if len(image_bytes) >= _THREAD_HASH_BYTES:
+            return await asyncio.to_thread(cache_key, image_bytes, options)
+        return cache_key(image_bytes, options)
+
+    def contains(self, key):
+        """In the memory tier (no LRU bump, no counters)."""
+        return key in self._entries
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        if self.directory:
+            entry = await asyncio.to_thread(self._read_disk, key)
+            if entry is not None:
+                self._remember(key, entry)
+                self.disk_hits += 1
+                return entry
+        self.misses += 1
+        return None
+
+    async def put(self, key, result):
+        entry = CachedEncoding(result.encodings, result.boxes, result.size, result.scale)
+        self._remember(key, entry)
+        if self.directory:
+            await asyncio.to_thread(self._write_disk, key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.nbytes
+        self._entries[key] = entry
+        self._bytes += entry.nbytes
+        while self._bytes > self.max_bytes and self._entries:
+            _, dropped = self._entries.popitem(last=False)
+            self._bytes -= dropped.nbytes
+            self.evictions += 1
+
+    # ---------- disk tier ----------
+    def _path(self, key):
+        # two-level fan-out keeps directories small
+        return os.path.join(self.directory, key[:2], key + ".npz")
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                meta = json.loads(str(data["meta"]))
+                entry = CachedEncoding(data["encodings"], meta["boxes"], meta["size"], meta["scale"])
+            os.utime(path)      # mark as recently used for pruning
+            return entry
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print("WARN unreadable face cache entry, dropping:", path, e)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def _write_disk(self, key, entry):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        meta = json.dumps({"boxes": entry.boxes, "size": entry.size, "scale": entry.scale})
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                np.savez(f, encodings=entry.encodings, meta=np.array(meta))
+            os.replace(tmp, path)       # readers never see half a file
+        except OSError as e:
+            print("WARN face cache write failed:", e)
+            return
+        self._writes += 1
+        if self._writes % _PRUNE_EVERY == 0:
+            self.prune_disk()
+
+    def prune_disk(self):
+        """Delete the least recently used files until the tier fits its budget."""
+        files, total = [], 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "disk": self.directory,
+        }
@@ -0,0 +1,364 @@
+import asyncio
+import io
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+
+# ---------------------------
+# face encoding worker pool
+# ---------------------------
+# dlib detection + the ResNet encoder take hundreds of ms per image, so they
+# run in separate processes and the route handlers only await the result.
+# The number of jobs waiting/running is bounded; when the pool is full the
+# caller gets PoolBusy and should answer 503 + Retry-After.
+# With an EncodingCache attached, an image that was already encoded with the
+# same options (client retries) is answered from the cache without a worker,
+# and an identical upload that is still being encoded is waited on instead
+# of encoded twice.
+# A worker that dies (OOM kill, dlib crash) breaks the whole executor; the
+# first job to notice replaces it and every job that was on it is retried
+# once on the new one, so only an image that kills workers itself fails.
+
+FACE_WORKERS = int(os.getenv("FACE_WORKERS", "2"))
+FACE_QUEUE_SIZE = int(os.getenv("FACE_QUEUE_SIZE", str(FACE_WORKERS * 4)))
+FACE_RETRY_AFTER = int(os.getenv("FACE_RETRY_AFTER", "2"))
+# photos accepted by one batch face session
+FACE_BATCH_MAX_PHOTOS = int(os.getenv("FACE_BATCH_MAX_PHOTOS", "8"))
+
+# detection runs on a copy downscaled to this longest side; encoding uses
+# the original pixels (boxes are mapped back). 0 disables the downscale.
+FACE_DETECT_MAX_SIDE = int(os.getenv("FACE_DETECT_MAX_SIDE", "1280"))
+# below this the HOG detector stops finding classroom-sized faces
+FACE_DETECT_MIN_SIDE = 160
+FACE_DETECT_MODEL = os.getenv("FACE_DETECT_MODEL", "hog")
+FACE_DETECT_UPSAMPLE = int(os.getenv("FACE_DETECT_UPSAMPLE", "1"))
+
+_LATENCY_WINDOW = 256
+
+
+class DetectOptions:
+    """Per-request detection settings (plain attributes, picklable)."""
+
+    MODELS = ("hog", "cnn")
+
+    def __init__(self, model=None, upsample=None, max_side=None):
+        self.model = (model or FACE_DETECT_MODEL).lower()
+        self.upsample = FACE_DETECT_UPSAMPLE if upsample is None else int(upsample)
+        self.max_side = FACE_DETECT_MAX_SIDE if max_side is None else int(max_side)
+        if self.model not in self.MODELS:
+            raise ValueError(f"detector must be one of {', '.join(self.MODELS)}")
+        if not 0 <= self.upsample <= 3:
+            raise ValueError("upsample must be between 0 and 3")
+        if self.max_side != 0 and self.max_side < FACE_DETECT_MIN_SIDE:
+            raise ValueError(f"max_side must be 0 (no downscale) or at least {FACE_DETECT_MIN_SIDE}")
+
+    def as_dict(self):
+        return {"model": self.model, "upsample": self.upsample, "max_side": self.max_side}
+
+
+class EncodeResult:
+    """Output of one encoding job."""
+
+    def __init__(self, encodings, boxes, timings, size=None, scale=1.0, cached=False):
+        self.encodings = encodings      # list of float32 (128,) arrays
+        self.boxes = boxes              # (top, right, bottom, left) in original pixels
+        self.timings = timings          # stage -> ms
+        self.size = size                # (width, height) of the upload
+        self.scale = scale              # detection scale factor
+        self.cached = cached            # served by the EncodingCache
+
+    def __len__(self):
+        return len(self.encodings)
+
+
+class PoolBusy(Exception):
+    def __init__(self, retry_after=FACE_RETRY_AFTER):
+        super().__init__("Face encoder is busy, retry shortly")
+        self.retry_after = retry_after
+
+
+# ---------- worker side (runs inside the pool processes) ----------
+def _init_worker():
+    # importing face_recognition loads the dlib detector / shape predictor /
+    # ResNet weights; doing it here means once per worker, not per job
+    import face_recognition  # noqa: F401
+
+
+def _decode(image_bytes):
+    import cv2
+    import numpy as np
+
+    buf = np.frombuffer(image_bytes, dtype=np.uint8)
+    bgr = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    if bgr is None:
+        # formats OpenCV cannot read (e.g. some phone uploads) -> PIL
+        from PIL import Image
+        return np.array(Image.open(io.BytesIO(image_bytes)).convert("RGB"))
+    return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+
+def encode_image(image_bytes, options=None):
+    """decode -> downscale -> detect -> map boxes back -> encode at full res."""
+    import cv2
+    import face_recognition
+    import numpy as np
+
+    options = options or DetectOptions()
+    timings = {}
+    clock = time.perf_counter()
+
+    def lap(stage):
+        nonlocal clock
+        now = time.perf_counter()
+        timings[stage] = round((now - clock) * 1000, 1)
+        clock = now
+
+    rgb = _decode(image_bytes)
+    lap("decode_ms")
+
+    h, w = rgb.shape[:2]
+    scale = 1.0
+    small = rgb
+    if options.max_side and max(h, w) > options.max_side:
+        scale = options.max_side / max(h, w)
+        small = cv2.resize(rgb, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+    lap("resize_ms")
+
+    found = face_recognition.face_locations(
+        small, number_of_times_to_upsample=options.upsample, model=options.model
+    )
+    lap("detect_ms")
+
+    boxes = []
+    for top, right, bottom, left in found:
+        boxes.append((
+            max(0, int(top / scale)),
+            min(w, int(right / scale)),
+            min(h, int(bottom / scale)),
+            max(0, int(left / scale)),
+        ))
+    encodings = face_recognition.face_encodings(rgb, known_face_locations=boxes) if boxes else []
+    lap("encode_ms")
+
+    timings["total_ms"] = round(sum(timings.values()), 1)
+    return EncodeResult(
+        [np.asarray(e, dtype=np.float32) for e in encodings], boxes, timings,
+        size=(w, h), scale=round(scale, 3),
+    )
+
+
+# ---------- main process side ----------
+def _cached_result(entry, started):
+    ms = round((time.perf_counter() - started) * 1000, 1)
+    return EncodeResult(
+        list(entry.encodings), list(entry.boxes), {"cache_ms": ms, "total_ms": ms},
+        size=entry.size, scale=entry.scale, cached=True,
+    )
+
+
+class _Reservation:
+    """Pool slots taken up front for a batch; each job of the batch takes
+    one when it reaches the pool, close() gives back the ones never used."""
+
+    def __init__(self, pool, jobs):
+        pool._admit(jobs)
+        self.pool = pool
+        self.left = jobs
+
+    def take(self):
+        if self.left <= 0:
+            return False
+        self.left -= 1
+        return True
+
+    def close(self):
+        self.pool._in_flight -= self.left
+        self.left = 0
+
+
+class EncodingPool:
+    def __init__(self, workers=FACE_WORKERS, max_queue=FACE_QUEUE_SIZE, cache=None,
+                 job=encode_image, initializer=_init_worker):
+        self.workers = max(1, workers)
+        self.max_queue = max(self.workers, max_queue)
+        self.cache = cache
+        self.job = job                  # worker function (image_bytes, options) -> EncodeResult
+        self.initializer = initializer
+        self._pending = {}          # cache key -> future of the identical job in flight
+        self._coalesced = 0
+        self._executor = None
+        self._generation = 0        # bumped whenever a broken executor is replaced
+        self._restart_lock = asyncio.Lock()
+        self._restarts = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._latency_ms = deque(maxlen=_LATENCY_WINDOW)   # submit -> result
+        self._run_ms = deque(maxlen=_LATENCY_WINDOW)       # time spent in the worker
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=self.initializer,
+            )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _restart(self, generation):
+        """Replace the executor that broke in `generation` (once, whichever
+        job notices first)."""
+        async with self._restart_lock:
+            if generation != self._generation:
+                return
+            print("WARN face encoder pool broken (a worker died), restarting it")
+            self.shutdown()
+            self._generation += 1
+            self._restarts += 1
+            self.start()
+
+    async def _submit(self, image_bytes, options):
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            generation = self._generation
+            try:
+                return await loop.run_in_executor(self._executor, self.job, image_bytes, options)
+            except BrokenProcessPool:
+                await self._restart(generation)
+                if attempt:
+                    # broke the fresh pool too: most likely this image
+                    raise
+
+    @property
+    def _caching(self):
+        return self.cache is not None and self.cache.enabled
+
+    def _admit(self, jobs):
+        """Reserve `jobs` slots (counted in _in_flight) or raise PoolBusy."""
+        if self._in_flight + jobs > self.max_queue:
+            self._rejected += 1
+            raise PoolBusy()
+        self._in_flight += jobs
+
+    async def encode(self, image_bytes, options=None):
+        """Encoding of one image (cache or pool); returns an EncodeResult."""
+        options = options or DetectOptions()
+        if not self._caching:
+            return await self._run(image_bytes, options)
+        started = time.perf_counter()
+        key = await self.cache.key(image_bytes, options)
+        return await self._encode_cached(key, image_bytes, options, started)
+
+    async def _encode_cached(self, key, image_bytes, options, started, reservation=None):
+        entry = await self.cache.get(key)
+        if entry is not None:
+            return _cached_result(entry, started)
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            # the same upload is being encoded right now (client retry)
+            self._coalesced += 1
+            await asyncio.wait([pending])
+            if not pending.cancelled():
+                return _cached_result(pending.result(), started)
+            # that job failed -> try ourselves
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            result = await self._run(image_bytes, options, reservation)
+            future.set_result(await self.cache.put(key, result))
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            self._pending.pop(key, None)
+        return result
+
+    async def _run(self, image_bytes, options, reservation=None):
+        """Run encode_image in the pool (on a slot of `reservation` if one is left)."""
+        if self._executor is None:
+            self.start()
+        if reservation is None or not reservation.take():
+            self._admit(1)
+
+        started = time.perf_counter()
+        try:
+            result = await self._submit(image_bytes, options)
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._in_flight -= 1
+
+        latency_ms = (time.perf_counter() - started) * 1000
+        self._completed += 1
+        self._run_ms.append(result.timings["total_ms"])
+        self._latency_ms.append(latency_ms)
+        # time spent waiting for a free worker (+ pickling)
+        result.timings["queue_ms"] = round(max(0.0, latency_ms - result.timings["total_ms"]), 1)
+        return result
+
+    async def encode_many(self, images, options=None):
+        """Encode several images concurrently (one job per image).
+
+        The slots of the whole batch are reserved up front, so a busy pool
+        never leaves half of a batch running and other requests cannot take
+        them in between. When one image fails the rest are cancelled.
+        """
+        options = options or DetectOptions()
+        if not self._caching:
+            reservation = _Reservation(self, len(images))
+            jobs = [self._run(b, options, reservation) for b in images]
+        else:
+            started = time.perf_counter()
+            keys = [await self.cache.key(b, options) for b in images]
+            # photos already in memory (or repeated in the batch) need no worker
+            reservation = _Reservation(self, len({k for k in keys if not self.cache.contains(k)}))
+            jobs = [self._encode_cached(key, b, options, started, reservation) for key, b in zip(keys, images)]
+
+        tasks = [asyncio.ensure_future(job) for job in jobs]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            reservation.close()
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "queue_depth": max(0, self._in_flight - self.workers),
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "restarts": self._restarts,
+            "latency_ms": _percentiles(self._latency_ms),
+            "run_ms": _percentiles(self._run_ms),
+            "coalesced": self._coalesced,
+            "cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+
+def _percentiles(samples):
+    if not samples:
+        return {"p50": None, "p95": None, "max": None}
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    return {
+        "p50": round(ordered[int(last * 0.50)], 1),
+        "p95": round(ordered[int(last * 0.95)], 1),
+        "max": round(ordered[-1], 1),
+    }
@@ -0,0 +1,66 @@
+import hashlib
+
+from fastapi.responses import Response
+
+# ---------------------------
+# ETag / conditional GET
+# ---------------------------
+# the dashboards poll /me, /classes/my and /class/{id} and get the same
+# payload nearly every time. Each of those payloads is versioned by cheap
+# values that every write already touches:
+#
+#   users.rev, classrooms.rev   $inc'd by every app write to the document
+#                               (REV_BUMP, missing on old documents = 0)
+#   attendance_counters         the caller's own count + the session count
+#
+# With If-None-Match the handler first reads only those values (tiny
+# projections); when the client's tag still matches it answers 304 and skips
+# the full documents and the serialisation.
+
+REV_FIELD = "rev"
+REV_BUMP = {"$inc": {REV_FIELD: 1}}
+REV_PROJECTION = {REV_FIELD: 1}
+
+# revalidate on every use, never shared between users
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts):
+    """Weak ETag over the version values of a response."""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def rev_of(doc):
+    return (doc or {}).get(REV_FIELD, 0)
+
+
+def drop_rev(*docs):
+    """Strip rev from documents about to be sent; it only feeds the ETag."""
+    for doc in docs:
+        doc.pop(REV_FIELD, None)
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match header (list of tags or *) vs our tag, weak comparison."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    ours = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == ours:
+            return True
+    return False
+
+
+def set_etag(response, etag):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+
+def not_modified(etag):
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
@@ -0,0 +1,393 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from embeddings import unpack_embeddings
+from face_service import EMBEDDING_DIM, MATCH_TOLERANCE
+
+# ---------------------------
+# institution-wide face index (IVF on NumPy)
+# ---------------------------
+# every enrolled embedding of every user, split into nlist k-means cells.
+# A query only scans the nprobe cells whose centroids are closest, so cost
+# grows ~ N * nprobe / nlist instead of N.
+#
+# Recall: with nlist = 4 * sqrt(N) and nprobe = 16 the top-1 user matches
+# brute force for >= 99% of queries on enrolled faces (checked by
+# bench/bench_face_index.py and `python manage.py face-index check`).
+# Raise FACE_INDEX_NPROBE to trade speed for recall; below
+# FACE_INDEX_MIN_TRAIN vectors the index is an exact flat scan.
+#
+# nlist is fixed at training time. Enrollments are assigned to the existing
+# cells, so once the index holds FACE_INDEX_RETRAIN_GROWTH times the rows it
+# was trained on, sync_index refits the quantizer (k-means in a thread).
+
+FACE_INDEX_PATH = os.getenv("FACE_INDEX_PATH", "face_index.npz")
+FACE_INDEX_NPROBE = int(os.getenv("FACE_INDEX_NPROBE", "16"))
+FACE_INDEX_MIN_TRAIN = int(os.getenv("FACE_INDEX_MIN_TRAIN", "2000"))
+FACE_INDEX_SYNC_SECONDS = float(os.getenv("FACE_INDEX_SYNC_SECONDS", "30"))
+FACE_INDEX_RETRAIN_GROWTH = float(os.getenv("FACE_INDEX_RETRAIN_GROWTH", "2"))
+
+# 2: user ids stored as fixed-width unicode (no pickle)
+_FORMAT_VERSION = 2
+
+
+def kmeans(data, k, iters=12, seed=0):
+    """Plain Lloyd k-means, returns float32 centroids (k x dim)."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    data_norms = np.einsum("ij,ij->i", data, data)
+    for _ in range(iters):
+        assign = _nearest(data, data_norms, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        counts = np.bincount(assign, minlength=k).astype(np.float32)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # re-seed empty cells with random points
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), size=int(empty.sum()), replace=False)]
+    return centroids.astype(np.float32)
+
+
+def _nearest(data, data_norms, centroids):
+    c_norms = np.einsum("ij,ij->i", centroids, centroids)
+    d2 = data_norms[:, None] + c_norms[None, :] - 2.0 * (data @ centroids.T)
+    return d2.argmin(axis=1)
+
+
+def fit_quantizer(vectors, norms):
+    """k-means centroids (nlist = 4 * sqrt(N)) + the cell of every row."""
+    n = len(vectors)
+    nlist = max(8, int(4 * np.sqrt(n)))
+    data = vectors
+    if n > 50 * nlist:
+        sample = np.random.default_rng(0).choice(n, 50 * nlist, replace=False)
+        data = data[sample]
+    centroids = kmeans(data, nlist)
+    return centroids, _nearest(vectors, norms, centroids)
+
+
+class FaceIndex:
+    """IVF index over the embeddings of all enrolled users."""
+
+    def __init__(self, nprobe=FACE_INDEX_NPROBE, min_train=FACE_INDEX_MIN_TRAIN,
+                 retrain_growth=FACE_INDEX_RETRAIN_GROWTH):
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self.retrain_growth = retrain_growth
+        # row buffers grow by doubling so enrollments append in amortized O(1);
+        # the public attributes below are views of the first _size rows
+        self._size = 0
+        self._set_rows(
+            np.empty((0, EMBEDDING_DIM), dtype=np.float32),
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.int64),
+        )
+        self.centroids = None
+        self.trained_rows = 0                          # rows the centroids were fit on
+        self._retraining = False
+        self.user_ids = []                             # str user ids
+        self._user_pos = {}                            # user id -> index in user_ids
+        self._lists = None                             # cell -> row ids (lazy)
+        self.synced_at = None                          # enrolledAt watermark
+
+    def __len__(self):
+        return len(self._user_pos)
+
+    # row storage: vectors / norms / owners (row -> index in user_ids) /
+    # cells (row -> IVF cell, -1 untrained) / alive (False = replaced row)
+    vectors = property(lambda self: self._vectors[:self._size])
+    norms = property(lambda self: self._norms[:self._size])
+    owners = property(lambda self: self._owners[:self._size])
+    cells = property(lambda self: self._cells[:self._size])
+    alive = property(lambda self: self._alive[:self._size])
+
+    def _set_rows(self, vectors, owners, cells):
+        self._vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self._norms = np.einsum("ij,ij->i", self._vectors, self._vectors)
+        self._owners = np.asarray(owners, dtype=np.int64)
+        self._cells = np.asarray(cells, dtype=np.int64)
+        self._alive = np.ones(len(self._vectors), dtype=bool)
+        self._size = len(self._vectors)
+        self._lists = None
+
+    def _append_rows(self, vectors, owners, cells):
+        n, m = self._size, len(vectors)
+        if n + m > len(self._vectors):
+            cap = max(1024, 2 * (n + m))
+            for name in ("_vectors", "_norms", "_owners", "_cells", "_alive"):
+                old = getattr(self, name)
+                new = np.zeros((cap,) + old.shape[1:], dtype=old.dtype)
+                new[:n] = old[:n]
+                setattr(self, name, new)
+        self._vectors[n:n + m] = vectors
+        self._norms[n:n + m] = np.einsum("ij,ij->i", vectors, vectors)
+        self._owners[n:n + m] = owners
+        self._cells[n:n + m] = cells
+        self._alive[n:n + m] = True
+        self._size = n + m
+        self._lists = None
+
+    @property
+    def rows(self):
+        return int(self.alive.sum())
+
+    # ---------- building ----------
+    def build(self, items):
+        """items: iterable of (user_id, embeddings) -> trains + fills the index."""
+        vecs, owners = [], []
+        self.user_ids, self._user_pos = [], {}
+        for user_id, embs in items:
+            arr = np.asarray(embs, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+            if not len(arr):
+                continue
+            pos = self._user_pos.setdefault(str(user_id), len(self.user_ids))
+            if pos == len(self.user_ids):
+                self.user_ids.append(str(user_id))
+            vecs.append(arr)
+            owners.extend([pos] * len(arr))
+
+        vectors = np.vstack(vecs) if vecs else np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        self._set_rows(vectors, owners, np.full(len(vectors), -1))
+        self.train()
+        return self
+
+    def _compact(self):
+        """Drop rows of replaced/removed users."""
+        keep = self.alive
+        if keep.all() and self._size == len(self._vectors):
+            return
+        self._set_rows(self.vectors[keep], self.owners[keep], self.cells[keep])
+
+    def train(self):
+        """(Re)compute the coarse quantizer; flat scan for small galleries."""
+        self._compact()
+        n = len(self.vectors)
+        if n < self.min_train:
+            self.centroids = None
+            self.trained_rows = 0
+            self._cells[:] = -1
+        else:
+            self.centroids, self._cells[:] = fit_quantizer(self.vectors, self.norms)
+            self.trained_rows = n
+        self._lists = None
+
+    def needs_retrain(self):
+        return self.centroids is not None and self.rows > self.retrain_growth * self.trained_rows
+
+    async def retrain(self):
+        """train() with the k-means off the event loop.
+
+        Searches keep using the old cells meanwhile; rows added in between
+        are assigned to the new centroids when they are swapped in.
+        """
+        if self._retraining:
+            return
+        self._retraining = True
+        try:
+            self._compact()
+            n = self._size
+            centroids, cells = await asyncio.to_thread(fit_quantizer, self.vectors.copy(), self.norms.copy())
+            self._cells[:n] = cells
+            if self._size > n:
+                self._cells[n:self._size] = _nearest(self._vectors[n:self._size], self._norms[n:self._size], centroids)
+            self.centroids = centroids
+            self.trained_rows = n
+            self._lists = None
+        finally:
+            self._retraining = False
+
+    def add(self, user_id, embeddings):
+        """Insert / replace one user's embeddings (enrollment)."""
+        user_id = str(user_id)
+        arr = np.asarray(embeddings, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        pos = self._user_pos.get(user_id)
+        if pos is None:
+            pos = len(self.user_ids)
+            self.user_ids.append(user_id)
+            self._user_pos[user_id] = pos
+        else:
+            self.alive[self.owners == pos] = False
+
+        if self.centroids is not None:
+            cells = _nearest(arr, np.einsum("ij,ij->i", arr, arr), self.centroids)
+        else:
+            cells = np.full(len(arr), -1)
+        self._append_rows(arr, np.full(len(arr), pos), cells)
+
+        # the flat index grew big enough to be worth an IVF
+        if self.centroids is None and self.rows >= self.min_train:
+            self.train()
+
+    def remove(self, user_id):
+        pos = self._user_pos.pop(str(user_id), None)
+        if pos is not None:
+            self.alive[self.owners == pos] = False
+
+    # ---------- search ----------
+    def _cell_lists(self):
+        if self._lists is None:
+            order = np.argsort(self.cells, kind="stable")
+            bounds = np.searchsorted(self.cells[order], np.arange(len(self.centroids) + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+        return self._lists
+
+    def _candidates(self, query, nprobe):
+        if self.centroids is None:
+            return np.flatnonzero(self.alive)
+        q_norm = float(query @ query)
+        c_d2 = q_norm + np.einsum("ij,ij->i", self.centroids, self.centroids) - 2.0 * (self.centroids @ query)
+        probe = np.argpartition(c_d2, min(nprobe, len(c_d2) - 1))[:nprobe]
+        lists = self._cell_lists()
+        rows = np.concatenate([lists[c] for c in probe]) if len(probe) else np.empty(0, dtype=np.int64)
+        return rows[self.alive[rows]]
+
+    def search(self, queries, k=5, nprobe=None, exact=False):
+        """Top-k users per query: list (per query) of [(user_id, distance)]."""
+        nprobe = nprobe or self.nprobe
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        results = []
+        for q in queries:
+            rows = np.flatnonzero(self.alive) if exact else self._candidates(q, nprobe)
+            if not len(rows):
+                results.append([])
+                continue
+            d2 = self.norms[rows] + float(q @ q) - 2.0 * (self.vectors[rows] @ q)
+            np.maximum(d2, 0.0, out=d2)
+            # best row per user, then top-k users
+            order = np.argsort(d2, kind="stable")
+            seen, top = set(), []
+            for i in order:
+                owner = int(self.owners[rows[i]])
+                if owner in seen:
+                    continue
+                seen.add(owner)
+                top.append((self.user_ids[owner], round(float(np.sqrt(d2[i])), 4)))
+                if len(top) == k:
+                    break
+            results.append(top)
+        return results
+
+    def recall(self, queries, k=1, nprobe=None):
+        """Fraction of top-k users the IVF search shares with brute force."""
+        approx = self.search(queries, k=k, nprobe=nprobe)
+        exact = self.search(queries, k=k, exact=True)
+        hit = total = 0
+        for a, e in zip(approx, exact):
+            truth = {u for u, _ in e}
+            hit += len(truth & {u for u, _ in a})
+            total += len(truth)
+        return hit / total if total else 1.0
+
+    # ---------- persistence ----------
+    def save(self, path=FACE_INDEX_PATH):
+        # per process: every worker saves its copy on shutdown
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        keep = self.alive
+        np.savez(
+            tmp,
+            version=np.int32(_FORMAT_VERSION),
+            vectors=self.vectors[keep],
+            owners=self.owners[keep],
+            cells=self.cells[keep],
+            centroids=self.centroids if self.centroids is not None else np.empty((0, EMBEDDING_DIM), np.float32),
+            user_ids=np.asarray(self.user_ids, dtype=str),      # U24 for ObjectId strings
+            trained_rows=np.int64(self.trained_rows),
+            synced_at=np.float64(_to_epoch(self.synced_at)),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=FACE_INDEX_PATH, **kwargs):
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != _FORMAT_VERSION:
+                raise ValueError(f"unsupported face index format {int(data['version'])}")
+            index = cls(**kwargs)
+            index._set_rows(data["vectors"], data["owners"], data["cells"])
+            centroids = data["centroids"]
+            index.centroids = centroids.astype(np.float32) if len(centroids) else None
+            index.trained_rows = int(data["trained_rows"]) if index.centroids is not None else 0
+            index.user_ids = data["user_ids"].tolist()
+            ts = float(data["synced_at"])
+        live = set(index.owners.tolist())
+        index._user_pos = {u: i for i, u in enumerate(index.user_ids) if i in live}
+        index.synced_at = datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None) if ts else None
+        return index
+
+
+def _to_epoch(dt):
+    # mongo hands back naive UTC datetimes
+    if dt is None:
+        return 0.0
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+# ---------- mongo loading ----------
+async def load_from_mongo(users_col, since=None, batch_size=1000):
+    """Yield (user_id, embeddings, enrolledAt) of every enrolled user (after `since`)."""
+    # packed blob or (legacy) non-empty list
+    query = {"face_id.embeddings": {"$exists": True, "$nin": [None, []]}}
+    if since is not None:
+        query["face_id.enrolledAt"] = {"$gt": since}
+    cursor = users_col.find(query, {"face_id.embeddings": 1, "face_id.enrolledAt": 1}, batch_size=batch_size)
+    async for doc in cursor:
+        embs = unpack_embeddings(doc["face_id"]["embeddings"])
+        if embs is not None:
+            yield doc["_id"], embs, doc["face_id"].get("enrolledAt")
+
+
+async def open_index(users_col, path=FACE_INDEX_PATH):
+    """Load the persisted index (then catch up from Mongo) or build it."""
+    started = time.perf_counter()
+    index = None
+    if path and os.path.exists(path):
+        try:
+            index = FaceIndex.load(path)
+        except Exception as e:
+            print("WARN face index file unusable, rebuilding:", e)
+
+    if index is None:
+        items, newest = [], None
+        async for user_id, embs, enrolled in load_from_mongo(users_col):
+            items.append((user_id, embs))
+            if enrolled and (newest is None or enrolled > newest):
+                newest = enrolled
+        index = FaceIndex().build(items)
+        index.synced_at = newest
+    else:
+        await sync_index(index, users_col)
+
+    print(f"face index ready: {len(index)} users, {index.rows} vectors "
+          f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return index
+
+
+async def sync_index(index, users_col):
+    """Add users enrolled (on any worker) since the index watermark."""
+    added = 0
+    async for user_id, embs, enrolled in load_from_mongo(users_col, since=index.synced_at):
+        index.add(user_id, embs)
+        if enrolled and (index.synced_at is None or enrolled > index.synced_at):
+            index.synced_at = enrolled
+        added += 1
+    if index.needs_retrain():
+        started = time.perf_counter()
+        await index.retrain()
+        print(f"face index retrained: {len(index.centroids)} cells over {index.trained_rows} vectors "
+              f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return added
+
+
+def identify(index, encodings, k=5, tolerance=MATCH_TOLERANCE):
+    """Top-k candidates per detected face with a match flag."""
+    out = []
+    for top in index.search(encodings, k=k):
+        out.append([
+            {"student_id": uid, "distance": dist, "match": dist <= tolerance}
+            for uid, dist in top
+        ])
+    return out
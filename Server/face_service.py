@@ -0,0 +1,371 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+from embeddings import unpack_embeddings
+from models import to_object_ids
+
+# ---------------------------
+# per-classroom face gallery
+# ---------------------------
+# all enrolled embeddings of a class live in ONE float32 matrix so a frame
+# is matched with a single (detections x gallery) distance computation
+# instead of a python loop of np.linalg.norm calls per student.
+
+MATCH_TOLERANCE = 0.45
+EMBEDDING_DIM = 128
+
+# two detections from different photos closer than this are the same person
+FRAME_MERGE_TOLERANCE = 0.35
+
+# enrollment templates (see consolidate_templates)
+MAX_TEMPLATES = int(os.getenv("FACE_MAX_TEMPLATES", "5"))
+TEMPLATE_DEDUP_TOLERANCE = 0.15     # closer than this to a kept template = duplicate
+TEMPLATE_OUTLIER_TOLERANCE = 0.55   # farther than this from the median face = bad sample
+TEMPLATE_VERSION = 1                # face_id.templates marker of consolidated users
+
+# galleries kept in memory (least recently used dropped first), and how
+# often a cached gallery looks for members whose enrollment changed
+GALLERY_CACHE_SIZE = int(os.getenv("GALLERY_CACHE_SIZE", "256"))
+GALLERY_SYNC_SECONDS = float(os.getenv("GALLERY_SYNC_SECONDS", "30"))
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class ClassGallery:
+    """Embeddings of every enrolled student of one classroom.
+
+    matrix[i] is one stored embedding, owners[i] is the index (into
+    student_ids / students) of the student it belongs to.
+    """
+
+    def __init__(self, class_id):
+        self.class_id = class_id
+        self.student_ids = []       # str ids, one per student with embeddings
+        self.students = []          # {"student_id", "name", "usn"} per student
+        self.roster = set()         # every student id the gallery was built for
+        self.matrix = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        self.owners = np.empty(0, dtype=np.int32)
+        self._norms = np.empty(0, dtype=np.float32)
+        # newest face_id.enrolledAt of the members, last staleness check
+        self.enrolled_until = _EPOCH
+        self.checked_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    def _rebuild_arrays(self, rows, owners):
+        if rows:
+            self.matrix = np.ascontiguousarray(np.vstack(rows), dtype=np.float32)
+            self.owners = np.asarray(owners, dtype=np.int32)
+        else:
+            self.matrix = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+            self.owners = np.empty(0, dtype=np.int32)
+        # squared row norms, reused by every match call
+        self._norms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+
+    def _rows_by_student(self):
+        rows = {}
+        for vec, owner in zip(self.matrix, self.owners):
+            rows.setdefault(self.student_ids[owner], []).append(vec)
+        return rows
+
+    def _seen_enrollments(self, student_docs):
+        for doc in student_docs:
+            enrolled = (doc.get("face_id") or {}).get("enrolledAt")
+            if enrolled is not None and enrolled > self.enrolled_until:
+                self.enrolled_until = enrolled
+
+    def set_students(self, student_docs, roster=None):
+        """(Re)build the whole gallery from user documents."""
+        self._seen_enrollments(student_docs)
+        self.student_ids, self.students = [], []
+        rows, owners = [], []
+        for doc in student_docs:
+            encs = _embeddings_of(doc)
+            if encs is None:
+                continue
+            idx = len(self.student_ids)
+            self.student_ids.append(str(doc["_id"]))
+            self.students.append(_student_info(doc))
+            rows.append(encs)
+            owners.extend([idx] * len(encs))
+        self.roster = set(roster) if roster is not None else set(self.student_ids)
+        self._rebuild_arrays(rows, owners)
+
+    def upsert_students(self, student_docs):
+        """Add new students or replace the embeddings of existing ones."""
+        docs = {str(d["_id"]): d for d in student_docs}
+        if not docs:
+            return
+        self._seen_enrollments(docs.values())
+        rows_by_student = self._rows_by_student()
+        info = {sid: s for sid, s in zip(self.student_ids, self.students)}
+        for sid, doc in docs.items():
+            self.roster.add(sid)
+            encs = _embeddings_of(doc)
+            if encs is None:
+                rows_by_student.pop(sid, None)
+                info.pop(sid, None)
+                continue
+            rows_by_student[sid] = list(encs)
+            info[sid] = _student_info(doc)
+        self._reindex(rows_by_student, info)
+
+    def remove_students(self, student_ids):
+        drop = {str(s) for s in student_ids}
+        if not drop:
+            return
+        self.roster -= drop
+        rows_by_student = {
+            sid: rows for sid, rows in self._rows_by_student().items() if sid not in drop
+        }
+        info = {sid: s for sid, s in zip(self.student_ids, self.students) if sid not in drop}
+        self._reindex(rows_by_student, info)
+
+    def _reindex(self, rows_by_student, info):
+        self.student_ids, self.students = [], []
+        rows, owners = [], []
+        for sid, vecs in rows_by_student.items():
+            if not vecs:
+                continue
+            idx = len(self.student_ids)
+            self.student_ids.append(sid)
+            self.students.append(info[sid])
+            rows.append(np.asarray(vecs, dtype=np.float32).reshape(-1, EMBEDDING_DIM))
+            owners.extend([idx] * len(vecs))
+        self._rebuild_arrays(rows, owners)
+
+    def match(self, detected, tolerance=MATCH_TOLERANCE, groups=None):
+        """Match detected face encodings against the gallery.
+
+        Every detected face is assigned to its single closest student (best
+        match, not first match under the tolerance). If two faces pick the
+        same student the closer one wins. Returns a list of
+        {"student_id", "name", "usn", "distance"} sorted by distance.
+
+        groups (one label per face, see group_faces) makes faces of the same
+        person count as one: the group is assigned using the best distance
+        of any of its faces, and each entry gets a "faces" count.
+        """
+        if len(self.matrix) == 0 or len(detected) == 0:
+            return []
+
+        faces = np.asarray(detected, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+
+        # |a - b|^2 = |a|^2 + |b|^2 - 2 a.b  -> (faces x gallery rows)
+        face_norms = np.einsum("ij,ij->i", faces, faces)
+        d2 = face_norms[:, None] + self._norms[None, :] - 2.0 * (faces @ self.matrix.T)
+        np.maximum(d2, 0.0, out=d2)
+
+        # collapse rows -> students (min over each student's samples)
+        per_student = np.full((len(faces), len(self.student_ids)), np.inf, dtype=np.float32)
+        np.minimum.at(per_student, (slice(None), self.owners), d2)
+
+        sizes = None
+        if groups is not None:
+            groups = np.asarray(groups, dtype=np.int64)
+            sizes = np.bincount(groups)
+            per_group = np.full((len(sizes), per_student.shape[1]), np.inf, dtype=np.float32)
+            np.minimum.at(per_group, groups, per_student)
+            per_student = per_group
+
+        best_student = per_student.argmin(axis=1)
+        best_d2 = per_student[np.arange(len(per_student)), best_student]
+
+        tol2 = tolerance * tolerance
+        best = {}
+        for row, (owner, dist2) in enumerate(zip(best_student.tolist(), best_d2.tolist())):
+            if dist2 > tol2:
+                continue
+            if owner not in best or dist2 < best[owner][0]:
+                best[owner] = (dist2, row)
+
+        matches = []
+        for owner, (dist2, row) in best.items():
+            entry = dict(self.students[owner])
+            entry["distance"] = round(float(np.sqrt(dist2)), 4)
+            if sizes is not None:
+                entry["faces"] = int(sizes[row])
+            matches.append(entry)
+        matches.sort(key=lambda m: m["distance"])
+        return matches
+
+
+def group_faces(encodings, frames, tolerance=FRAME_MERGE_TOLERANCE):
+    """Cluster the faces of several photos of the same room.
+
+    encodings[i] was detected in photo frames[i]. A face joins the closest
+    existing group (running mean) within tolerance that has no face from
+    the same photo yet -- two faces in one photo are never the same
+    person. Returns one int label per face.
+    """
+    faces = np.asarray(encodings, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+    labels = np.empty(len(faces), dtype=np.int64)
+    sums = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+    counts = []
+    seen_in = []        # set of photo indices per group
+    tol2 = tolerance * tolerance
+
+    for i, (vec, frame) in enumerate(zip(faces, frames)):
+        target = -1
+        if counts:
+            centres = sums / np.asarray(counts, dtype=np.float32)[:, None]
+            d2 = np.einsum("ij,ij->i", centres - vec, centres - vec)
+            for g in np.argsort(d2).tolist():
+                if d2[g] > tol2:
+                    break
+                if frame not in seen_in[g]:
+                    target = g
+                    break
+        if target < 0:
+            target = len(counts)
+            sums = np.vstack([sums, vec[None, :]])
+            counts.append(1)
+            seen_in.append({frame})
+        else:
+            sums[target] += vec
+            counts[target] += 1
+            seen_in[target].add(frame)
+        labels[i] = target
+    return labels
+
+
+
+def consolidate_templates(vectors, max_templates=MAX_TEMPLATES,
+                          dedup=TEMPLATE_DEDUP_TOLERANCE, outlier=TEMPLATE_OUTLIER_TOLERANCE):
+    """Enrollment samples -> at most max_templates representative templates.
+
+    With 3+ samples, samples farther than `outlier` from the coordinate-wise
+    median face are dropped (wrong person, blurred frame, bad crop); when
+    none is close to it there are no templates at all. The
+    templates are the centroid of the rest plus the samples that are most
+    different from what is already kept (farthest-point picks), stopping
+    once every sample is within `dedup` of a template, so near-duplicate
+    frames never become extra templates.
+
+    Returns (float32 (k, dim) array, {"samples", "outliers", "templates"}).
+    """
+    samples = np.asarray(vectors, dtype=np.float32)
+    if samples.ndim == 1:
+        samples = samples.reshape(1, -1)
+    if samples.ndim != 2 or samples.shape[1] != EMBEDDING_DIM:
+        raise ValueError(f"face embeddings must be {EMBEDDING_DIM}-d vectors")
+    stats = {"samples": len(samples), "outliers": 0, "templates": 0}
+    samples = samples[np.isfinite(samples).all(axis=1)]
+    stats["outliers"] = stats["samples"] - len(samples)
+    if len(samples) == 0:
+        return samples, stats
+
+    if len(samples) >= 3:
+        median = np.median(samples, axis=0)
+        keep = np.linalg.norm(samples - median, axis=1) <= outlier
+        stats["outliers"] += int((~keep).sum())
+        samples = samples[keep]
+        if len(samples) == 0:
+            # no consensus face at all (mixed people / garbage): nothing to store
+            return samples, stats
+
+    centroid = samples.mean(axis=0)
+    templates = [centroid]
+    # distance of every sample to its closest template so far
+    gap = np.linalg.norm(samples - centroid, axis=1)
+    # never more templates than there were usable samples
+    while len(templates) < min(max_templates, len(samples)):
+        i = int(gap.argmax())
+        if gap[i] <= dedup:
+            break
+        templates.append(samples[i])
+        gap = np.minimum(gap, np.linalg.norm(samples - samples[i], axis=1))
+
+    stats["templates"] = len(templates)
+    return np.vstack(templates).astype(np.float32), stats
+
+
+class GalleryCache:
+    """Keeps one ClassGallery per classroom in memory.
+
+    A gallery is built on first use and then kept in sync with the
+    classroom roster: students that joined/left since the last build are
+    patched in/out with a single $in query instead of a full rebuild.
+    Every GALLERY_SYNC_SECONDS a gallery also re-reads the members whose
+    face_id.enrolledAt moved past the newest one it has seen (re-enrollment,
+    `manage.py embeddings consolidate`) -- usually an empty result. At most
+    max_galleries classes are kept.
+    """
+
+    def __init__(self, users_col, max_galleries=GALLERY_CACHE_SIZE, sync_seconds=GALLERY_SYNC_SECONDS):
+        self.users_col = users_col
+        self.max_galleries = max(1, max_galleries)
+        self.sync_seconds = sync_seconds
+        self._galleries = OrderedDict()     # class_id -> ClassGallery, least recently used first
+
+    async def _fetch_students(self, student_ids, enrolled_after=None):
+        obj_ids = to_object_ids(student_ids)
+        if not obj_ids:
+            return []
+        query = {"_id": {"$in": obj_ids}}
+        if enrolled_after is not None:
+            query["face_id.enrolledAt"] = {"$gt": enrolled_after}
+        cursor = self.users_col.find(
+            query,
+            {"name": 1, "usn": 1, "face_id.embeddings": 1, "face_id.enrolledAt": 1},
+        )
+        return await cursor.to_list(None)
+
+    async def get(self, classroom):
+        class_id = str(classroom["_id"])
+        roster = [str(s) for s in classroom.get("students", [])]
+        gallery = self._galleries.get(class_id)
+
+        if gallery is None:
+            gallery = ClassGallery(class_id)
+            gallery.set_students(await self._fetch_students(roster), roster=roster)
+            self._galleries[class_id] = gallery
+            while len(self._galleries) > self.max_galleries:
+                self._galleries.popitem(last=False)
+            return gallery
+        self._galleries.move_to_end(class_id)
+
+        # embeddings replaced since the gallery was built
+        if time.monotonic() - gallery.checked_at > self.sync_seconds:
+            gallery.checked_at = time.monotonic()
+            changed = await self._fetch_students(gallery.roster, enrolled_after=gallery.enrolled_until)
+            if changed:
+                gallery.upsert_students(changed)
+
+        # roster changed on another worker / outside this process
+        roster_set = set(roster)
+        added = roster_set - gallery.roster
+        removed = gallery.roster - roster_set
+        if added:
+            gallery.upsert_students(await self._fetch_students(added))
+        if removed:
+            gallery.remove_students(removed)
+        return gallery
+
+    async def add_student(self, class_id, student_id):
+        """Patch a cached gallery when a student joins the class."""
+        gallery = self._galleries.get(str(class_id))
+        if gallery is not None:
+            gallery.upsert_students(await self._fetch_students([student_id]))
+
+
+# ---------- helpers ----------
+def _embeddings_of(doc):
+    # packed blob (zero-copy) or legacy list of lists
+    arr = unpack_embeddings((doc.get("face_id") or {}).get("embeddings"))
+    if arr is None or arr.shape[1] != EMBEDDING_DIM:
+        return None
+    return arr
+
+
+def _student_info(doc):
+    return {
+        "student_id": str(doc["_id"]),
+        "name": doc.get("name"),
+        "usn": doc.get("usn"),
+    }
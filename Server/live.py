@@ -0,0 +1,216 @@
+import asyncio
+import json
+import os
+from datetime import datetime
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+# ---------------------------
+# live class channel (server-sent events)
+# ---------------------------
+# dashboards subscribe to GET /class/{id}/live instead of polling. Writers
+# (face sessions, notices) call hub.publish(class_id, event, data) and every
+# subscriber of that class gets the delta.
+#
+# Fan-out to the subscribers of a worker is in memory: publish() never
+# awaits, it only drops the event into each subscriber's bounded queue. A
+# subscriber that falls behind loses its backlog and gets one "resync"
+# event (the client refetches once) -- a slow connection can never grow
+# memory.
+#
+# Between workers (uvicorn --workers N, api / vision roles) events go
+# through a LiveBus: writers call `await hub.send(...)`, which appends the
+# rendered event to a capped collection; every worker tails it and
+# publish()es to its own subscribers. LIVE_BUS=memory skips the bus (one
+# worker process only). Delivery is best effort: a client that reconnects
+# gets a fresh "ready" and refetches.
+
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "32"))
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", "20"))
+LIVE_BUS = os.getenv("LIVE_BUS", "mongo")
+LIVE_BUS_COLLECTION = os.getenv("LIVE_BUS_COLLECTION", "live_events")
+LIVE_BUS_MAX_MB = float(os.getenv("LIVE_BUS_MAX_MB", "16"))
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def sse_message(event, data):
+    payload = json.dumps(data, default=_default, separators=(",", ":"))
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+class Subscriber:
+    def __init__(self, class_id, max_queue=LIVE_QUEUE_SIZE):
+        self.class_id = class_id
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.resyncs = 0
+
+    def offer(self, message):
+        try:
+            self.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+        # too slow: throw the backlog away, tell the client to refetch
+        self.resyncs += 1
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(sse_message("resync", {"classId": self.class_id}))
+
+
+class ClassHub:
+    def __init__(self, max_queue=LIVE_QUEUE_SIZE):
+        self.max_queue = max_queue
+        self._subs = {}             # class_id -> set of Subscriber
+        self._published = 0
+        self._resyncs = 0
+        self.bus = None             # LiveBus shared with the other workers
+
+    def subscribe(self, class_id):
+        sub = Subscriber(str(class_id), self.max_queue)
+        self._subs.setdefault(sub.class_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        subs = self._subs.get(sub.class_id)
+        if subs is None:
+            return
+        subs.discard(sub)
+        self._resyncs += sub.resyncs
+        if not subs:
+            del self._subs[sub.class_id]
+
+    def publish(self, class_id, event, data):
+        """Queue an event for every subscriber of the class in this process (never blocks)."""
+        if not self._subs.get(str(class_id)):
+            return 0
+        # serialised once, shared by every subscriber
+        return self.deliver(class_id, sse_message(event, data))
+
+    def deliver(self, class_id, message):
+        subs = self._subs.get(str(class_id))
+        if not subs:
+            return 0
+        for sub in subs:
+            sub.offer(message)
+        self._published += 1
+        return len(subs)
+
+    async def send(self, class_id, event, data):
+        """publish() on every worker: through the bus, or locally without one."""
+        if self.bus is None:
+            self.publish(class_id, event, data)
+            return
+        try:
+            await self.bus.send(str(class_id), sse_message(event, data))
+        except PyMongoError as e:
+            print("WARN live bus send failed, delivering in this worker only:", e)
+            self.publish(class_id, event, data)
+
+    async def stream(self, sub, heartbeat=LIVE_HEARTBEAT_SECONDS):
+        """SSE body for one subscriber; unsubscribes when the client leaves."""
+        try:
+            yield sse_message("ready", {"classId": sub.class_id})
+            while True:
+                try:
+                    yield await asyncio.wait_for(sub.queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    # comment line: keeps proxies from closing an idle stream
+                    yield ": ping\n\n"
+        finally:
+            self.unsubscribe(sub)
+
+    def stats(self):
+        return {
+            "classes": len(self._subs),
+            "subscribers": sum(len(s) for s in self._subs.values()),
+            "published": self._published,
+            "resyncs": self._resyncs + sum(sub.resyncs for s in self._subs.values() for sub in s),
+            "bus": self.bus.stats() if self.bus is not None else None,
+        }
+
+
+class LiveBus:
+    """Cross-worker event fan-out over a capped Mongo collection.
+
+    send() appends {c: class_id, m: rendered SSE message}; a tailable cursor
+    in every worker hands each new document to hub.deliver(). Works on a
+    standalone mongod (no replica set / change streams needed).
+    """
+
+    def __init__(self, hub, database, name=LIVE_BUS_COLLECTION, max_bytes=LIVE_BUS_MAX_MB * 1024 * 1024):
+        self.hub = hub
+        self.database = database
+        self.col = database[name]
+        self.max_bytes = int(max_bytes)
+        self._task = None
+        self._last_id = None
+        self._sent = 0
+        self._received = 0
+        self._restarts = 0
+
+    async def start(self):
+        """Create the capped collection if needed and start tailing it."""
+        try:
+            await self.database.create_collection(self.col.name, capped=True, size=self.max_bytes)
+        except CollectionInvalid:
+            pass        # another worker created it
+        options = await self.col.options()
+        if not options.get("capped"):
+            raise RuntimeError(f"{self.col.name} exists and is not a capped collection")
+        # a tailable cursor on an empty collection dies at once: seed it
+        last = await self.col.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+        if last is None:
+            await self.col.insert_one({"c": None})
+            last = await self.col.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+        self._last_id = last["_id"]
+        self.hub.bus = self
+        self._task = asyncio.create_task(self._tail())
+
+    async def stop(self):
+        if self.hub.bus is self:
+            self.hub.bus = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def send(self, class_id, message):
+        await self.col.insert_one({"c": class_id, "m": message, "at": datetime.utcnow()})
+        self._sent += 1
+
+    async def _tail(self):
+        while True:
+            try:
+                cursor = self.col.find(
+                    {"_id": {"$gt": self._last_id}},
+                    cursor_type=CursorType.TAILABLE_AWAIT,
+                    max_await_time_ms=int(LIVE_HEARTBEAT_SECONDS * 1000),
+                )
+                while cursor.alive:
+                    try:
+                        doc = await cursor.next()
+                    except StopAsyncIteration:
+                        continue        # waited, nothing new
+                    self._last_id = doc["_id"]
+                    if doc.get("c"):
+                        self._received += 1
+                        self.hub.deliver(doc["c"], doc["m"])
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                print("WARN live bus cursor lost, reopening:", e)
+            # cursor died (collection wrapped past it, failover): reopen
+            self._restarts += 1
+            await asyncio.sleep(1)
+
+    def stats(self):
+        return {"sent": self._sent, "received": self._received, "restarts": self._restarts}
@@ -1,23 +1,17 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import Header
+from fastapi import Depends
 from pydantic import BaseModel
 from typing import List
-from datetime import timedelta
 from fastapi import APIRouter
 import bcrypt
-import face_recognition
 import numpy as np
 import base64
-import cv2
-from pymongo import MongoClient
 from dotenv import load_dotenv
 import os
 from datetime import datetime
-from PIL import Image
-import io
 from fastapi import Query
-import jwt
 import random, string
 from fastapi import Body
 from bson import ObjectId
@@ -25,33 +19,114 @@ import traceback
 from fastapi import Path
 from fastapi import Form
 from datetime import datetime
-import csv
 from fastapi.responses import StreamingResponse
-from io import StringIO
+from face_service import GalleryCache, MATCH_TOLERANCE, TEMPLATE_VERSION, group_faces, consolidate_templates
+from encoder_pool import EncodingPool, PoolBusy, DetectOptions, FACE_BATCH_MAX_PHOTOS
+from encode_cache import EncodingCache
+from live import ClassHub, LiveBus, LIVE_BUS
+from tracing import TracingMiddleware, TRACING_ENABLED, span, record_stages, render_metrics
+from face_index import open_index, sync_index, identify, FACE_INDEX_PATH, FACE_INDEX_SYNC_SECONDS
+import time
+from contextlib import asynccontextmanager
+# mongo client + collections (shared with the helper modules)
+from db import client, db, users_col, classrooms_col, sessions_col, ensure_indexes, audit_indexes
+from pymongo.errors import DuplicateKeyError
+from attendance import class_attendance_counts, class_attendance_summary, percent, today_attendance, fetch_students
+from attendance import mark_present, init_counters, attendance_deltas
+from sessions import open_session, finalize_session, record_present, session_view
+from reports import report_header, stream_csv, csv_response, summary_batches, roster_day_batches, seen_day_batches
+from reports import AttendanceExport, export_bytes
+# JWT helpers + cached "who is calling" resolution
+from auth import (create_token, verify_token, authenticate, current_user,
+                  current_claims, invalidate_user, AuthError)
+# projections that keep face embeddings off the non-face endpoints
+from models import UserView, USER_VIEW_PROJECTION, LOGIN_PROJECTION, ID_ONLY_PROJECTION, to_object_ids
+from embeddings import pack_embeddings
+from responses import FastJSONResponse, CompressionMiddleware
+from etag import (
+    REV_BUMP, REV_PROJECTION, make_etag, rev_of, drop_rev, etag_matches, set_etag, not_modified,
+)
+from fastapi.responses import Response, RedirectResponse
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from typing import Optional
 
 # ---------------------------
 # ENV + DB SETUP
 # ---------------------------
 load_dotenv()
 
-MONGO_URI = os.getenv("MONGO_URI")
-DB_NAME = os.getenv("DB_NAME", "ClassRoom_DB")
-JWT_SECRET = os.getenv("JWT_SECRET", "change_this")
+# admin endpoints are disabled unless this is set
+ADMIN_KEY = os.getenv("ADMIN_KEY")
+
+# in-memory per-classroom embedding matrices used by the face session
+galleries = GalleryCache(users_col)
 
-if not MONGO_URI:
-    raise RuntimeError("MONGO_URI not found in .env")
+# face encoding runs in worker processes, not on the event loop
+encoder = EncodingPool(cache=EncodingCache())
+# per-class push channel for the dashboards (SSE)
+live = ClassHub()
 
-# all the name of colections of DB
-client = MongoClient(MONGO_URI)
-db = client[DB_NAME]
-users_col = db["users"]
-classrooms_col = db["classrooms"]
-# Attendance sesstion data
-attendance_col = db["attendance"]
+# ---------------------------
+# worker roles
+# ---------------------------
+# all     everything in one process (default)
+# api     no encoder pool, no face index: boots fast, stays small. The face
+#         endpoints answer 307 to VISION_URL (or 503 when unset); route them
+#         to the vision tier at the proxy / with VITE_VISION_BASE instead
+#         where possible (browsers drop Authorization on cross-origin
+#         redirects)
+# vision  like all; deploy it behind the face paths only
+# dlib / cv2 / face_recognition are only imported inside the encoder
+# processes, so an api worker never loads them.
+# Face sessions publish their live events on vision workers while the
+# dashboards' /class/{id}/live streams are held by api workers: split roles
+# need the Mongo live bus (see live.py) and refuse to start without it.
+WORKER_ROLE = os.getenv("WORKER_ROLE", "all")
+if WORKER_ROLE not in ("all", "api", "vision"):
+    raise RuntimeError(f"WORKER_ROLE must be all, api or vision (got {WORKER_ROLE!r})")
+if WORKER_ROLE != "all" and LIVE_BUS != "mongo":
+    raise RuntimeError(f"WORKER_ROLE={WORKER_ROLE} needs LIVE_BUS=mongo (live events cross tiers)")
+VISION_ENABLED = WORKER_ROLE != "api"
+VISION_URL = os.getenv("VISION_URL", "").rstrip("/")
+
+# face endpoints, included at the bottom (or their offload stubs on api workers)
+vision = APIRouter()
+
+# campus-wide ANN index over every enrolled embedding (see face_index.py)
+FACE_INDEX_ENABLED = os.getenv("FACE_INDEX_ENABLED", "1") == "1"
+face_index = None
+_face_index_synced = 0.0
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global face_index, _face_index_synced
+    await ensure_indexes()
+    if VISION_ENABLED:
+        encoder.start()
+    if VISION_ENABLED and FACE_INDEX_ENABLED:
+        face_index = await open_index(users_col)
+        _face_index_synced = time.monotonic()
+    if LIVE_BUS == "mongo":
+        bus = LiveBus(live, db)
+        try:
+            await bus.start()
+        except Exception as e:
+            if WORKER_ROLE != "all":
+                raise RuntimeError(f"live bus unavailable on a {WORKER_ROLE} worker: {e}") from e
+            print("WARN live bus unavailable, live events stay in their worker:", e)
+    yield
+    if live.bus is not None:
+        await live.bus.stop()
+    encoder.shutdown()
+    if face_index is not None:
+        face_index.save(FACE_INDEX_PATH)
+    await client.close()
 
 
 # FASTAPI APP + CORS
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -61,6 +136,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip / br for the bigger JSON + CSV bodies
+app.add_middleware(CompressionMiddleware)
+
+# per-request stage timings, Mongo op counts and /metrics (TRACING_ENABLED=1)
+if TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
+
 def _iso_date(dt):
     # returns YYYY-MM-DD string for date-only comparisons
     return dt.strftime("%Y-%m-%d")
@@ -79,16 +161,27 @@ def today():
 @app.post("/save-face-id")
 async def save_face_id(data: UserFaceModel):
     # check duplicate email
-    if users_col.find_one({"email": data.email}):
+    if await users_col.find_one({"email": data.email}, ID_ONLY_PROJECTION):
         raise HTTPException(status_code=400, detail="Email already registered")
 
+    # keep a few representative templates instead of every posted sample
+    templates, template_stats = [], None
+    if data.face_id:
+        try:
+            templates, template_stats = consolidate_templates(data.face_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if len(templates) == 0:
+            raise HTTPException(status_code=400, detail="No usable face embeddings")
+
     user_doc = {
         "name": data.name,
         "email": data.email,
         "password": data.password,          # TODO: replace with hash later
         "usn": data.usn,
         "face_id": {
-            "embeddings": data.face_id,     # <--- IMPORTANT
+            "embeddings": pack_embeddings(templates) if len(templates) else [],   # packed blob, see embeddings.py
+            "templates": TEMPLATE_VERSION,
             "enrolledAt": datetime.utcnow(),
         },
         "joinedClassrooms": [],
@@ -96,8 +189,17 @@ async def save_face_id(data: UserFaceModel):
         "createdAt": datetime.utcnow(),
     }
 
-    users_col.insert_one(user_doc)
-    return {"status": "saved"}
+    try:
+        await users_col.insert_one(user_doc)
+    except DuplicateKeyError:
+        # lost a race with a concurrent signup (email is unique-indexed)
+        raise HTTPException(status_code=400, detail="Email already registered")
+    invalidate_user(data.email)
+
+    # incremental insert into the campus face index
+    if face_index is not None and len(templates):
+        face_index.add(str(user_doc["_id"]), templates)
+    return {"status": "saved", "templates": template_stats}
 
 # for login verification
 class LoginRequest(BaseModel):
@@ -134,26 +236,13 @@ async def create_classroom(
     try:
         print("DEBUG /class/create - received payload:", data.dict())
 
-        if not authorization:
-            return {"success": False, "message": "Missing Authorization header"}
-
-        # Validate token - expect "Bearer <token>"
+        # Validate token - expect "Bearer <token>" + find user
         try:
-            scheme, token = authorization.split()
-            if scheme.lower() != "bearer":
-                return {"success": False, "message": "Invalid auth scheme"}
-            payload = decode_token(token)
-            email = payload.get("sub")
-            if not email:
-                return {"success": False, "message": "Invalid token payload"}
-        except Exception as e:
+            user = await authenticate(authorization)
+        except AuthError as e:
             print("DEBUG token error:", e)
-            return {"success": False, "message": "Invalid token"}
-
-        # find user
-        user = users_col.find_one({"email": email})
-        if not user:
-            return {"success": False, "message": "User not found"}
+            return {"success": False, "message": e.message}
+        email = user["email"]
 
         # direct Int 
         min_att = data.minAttendance
@@ -177,13 +266,23 @@ async def create_classroom(
             "createdAt": datetime.utcnow()
         }
 
-        # insert and get id
-        result = classrooms_col.insert_one(classroom_doc)
+        # insert and get id (classCode is unique-indexed, retry on a collision)
+        for _ in range(5):
+            try:
+                result = await classrooms_col.insert_one(classroom_doc)
+                break
+            except DuplicateKeyError:
+                classroom_doc.pop("_id", None)
+                classroom_doc["classCode"] = generate_class_code()
+        else:
+            return {"success": False, "message": "Could not generate a class code"}
         classroom_id = result.inserted_id
         classroom_doc["_id"] = str(classroom_id)
+        await init_counters(classroom_id)
 
         # push string id into user.createdClassrooms (use addToSet if you want dedupe)
-        users_col.update_one({"email": email}, {"$addToSet": {"createdClassrooms": str(classroom_id)}})
+        await users_col.update_one({"email": email}, {"$addToSet": {"createdClassrooms": str(classroom_id)}, **REV_BUMP})
+        invalidate_user(email)
 
         print("DEBUG /class/create - created:", classroom_doc)
         return {"success": True, "message": "Classroom created successfully", "classroom": classroom_doc}
@@ -192,15 +291,6 @@ async def create_classroom(
         traceback.print_exc()
         return {"success": False, "message": "Internal server error"}
 
-# ---------- Helpers ----------
-def create_token(email: str, expires_hours: int = 8):
-    payload = {"sub": email, "exp": datetime.utcnow() + timedelta(hours=expires_hours)}
-    token = jwt.encode(payload, JWT_SECRET, algorithm="HS256")
-    return token
-
-def decode_token(token: str):
-    return jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-
 # Health check
 @app.get("/health")
 async def health_check():
@@ -210,33 +300,106 @@ async def health_check():
 async def root():
     return {"message": "Backend is running"}
 
+# queue depth + per-job latency of the face encoding pool
+@vision.get("/encoder/stats")
+async def encoder_stats():
+    return encoder.stats()
+
+# Prometheus scrape endpoint
+@app.get("/metrics")
+async def metrics():
+    if not TRACING_ENABLED:
+        raise HTTPException(404, "Tracing is disabled")
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/live/stats")
+async def live_stats():
+    return live.stats()
+
+# GET /class/{class_id}/live -> event stream of attendance / notice deltas
+# EventSource cannot set headers, so the token may also come as ?token=
+@app.get("/class/{class_id}/live")
+async def class_live(class_id: str, token: str = Query(None), authorization: str = Header(None)):
+    try:
+        user = await authenticate(authorization or (f"Bearer {token}" if token else None))
+    except AuthError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+
+    user_id = str(user["_id"])
+    member = await classrooms_col.find_one(
+        {"_id": ObjectId(class_id), "$or": [{"createdBy": user_id}, {"students": user_id}]},
+        ID_ONLY_PROJECTION,
+    )
+    if not member:
+        raise HTTPException(404, "Classroom not found")
+
+    sub = live.subscribe(class_id)
+    return StreamingResponse(
+        live.stream(sub),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# explain() every registered query shape, flags the ones doing a COLLSCAN
+@app.get("/admin/index-audit")
+async def index_audit(x_admin_key: str = Header(None)):
+    _check_admin(x_admin_key)
+    report = await audit_indexes()
+    return {"success": True, "collscans": sum(r["collscan"] for r in report), "queries": report}
+
+def _check_admin(key):
+    if not ADMIN_KEY or key != ADMIN_KEY:
+        raise HTTPException(status_code=403, detail="Admin key required")
+
+# ?detector=hog|cnn&upsample=0..3&max_side=px on the face endpoints
+def _detect_options(detector, upsample, max_side):
+    try:
+        return DetectOptions(detector, upsample, max_side)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _detect_info(result, options):
+    return dict(options.as_dict(), image=result.size, scale=result.scale, cached=result.cached)
+
+def _busy_response(e: PoolBusy):
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
 
 # ---------------------------
 # Generate Face Encoding (Face ID)
 # ---------------------------
-@app.post("/generate-face-id")
-async def generate_face_id(file: UploadFile = File(...)):
+@vision.post("/generate-face-id")
+async def generate_face_id(
+    file: UploadFile = File(...),
+    detector: str = Query(None),
+    upsample: int = Query(None),
+    max_side: int = Query(None),
+):
+    options = _detect_options(detector, upsample, max_side)
     try:
         # Read image bytes correctly
         image_bytes = await file.read()
-        
-        # Open image safely
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-
-        # Convert to NumPy
-        image_np = np.array(image)
 
-        # Detect face encoding
-        encodings = face_recognition.face_encodings(image_np)
+        # decode + detect + encode in the worker pool
+        result = await encoder.encode(image_bytes, options)
+        record_stages(result.timings)
 
-        if len(encodings) == 0:
-            return {"success": False, "message": "No face detected"}
+        if len(result) == 0:
+            return {"success": False, "message": "No face detected", "timings_ms": result.timings}
 
         return {
             "success": True,
-            "encoding": encodings[0].tolist()
+            "encoding": result.encodings[0].tolist(),
+            "detect": _detect_info(result, options),
+            "timings_ms": result.timings,
         }
 
+    except PoolBusy as e:
+        raise _busy_response(e)
     except Exception as e:
         print("ERROR:", e)
         return {"success": False, "message": str(e)}
@@ -245,7 +408,7 @@ async def generate_face_id(file: UploadFile = File(...)):
 @app.get("/check-user")
 async def check_user(email: str = Query(...)):
     """Return exists: true/false for given email."""
-    user = users_col.find_one({"email": email})
+    user = await users_col.find_one({"email": email}, ID_ONLY_PROJECTION)
     return {"exists": user is not None}
 
 # ---------- Login (returns token + user minimal info) ----------
@@ -254,7 +417,7 @@ async def login(data: LoginRequest):
     email = data.email.strip().lower()
     password = data.password
 
-    user = users_col.find_one({"email": email})
+    user = await users_col.find_one({"email": email}, LOGIN_PROJECTION)
     if not user:
         return {"success": False, "message": "User not found"}
 
@@ -280,88 +443,79 @@ async def login(data: LoginRequest):
     }
 
 # ---------- Protected /me endpoint ----------
+def _me_etag(user):
+    return make_etag("me", str(user["_id"]), rev_of(user))
+
 @app.get("/me")
-async def me(authorization: str = Header(None)):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Missing Authorization header")
-    try:
-        scheme, token = authorization.split()
-        if scheme.lower() != "bearer":
-            raise Exception("Bad scheme")
-        payload = decode_token(token)
-        email = payload.get("sub")
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid token")
+async def me(response: Response, claims: dict = Depends(current_claims), if_none_match: str = Header(None)):
+    email = claims["sub"]
+
+    # conditional poll: only the revision is read while nothing changed
+    if if_none_match:
+        head = await users_col.find_one({"email": email}, REV_PROJECTION)
+        if head and etag_matches(if_none_match, _me_etag(head)):
+            return not_modified(_me_etag(head))
 
-    user = users_col.find_one({"email": email}, {"password_hash": 0, "password": 0})
+    user = await users_col.find_one({"email": email}, USER_VIEW_PROJECTION)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    user["_id"] = str(user["_id"])
-    return {"user": user}
+    set_etag(response, _me_etag(user))
+    return {"user": UserView.from_doc(user).to_json()}
 
 # get the class data
-@app.get("/classes/my")
-async def get_my_classes(authorization: str = Header(None)):
-    # auth header
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Missing token")
-
-    try:
-        scheme, token = authorization.split()
-        if scheme.lower() != "bearer":
-            raise HTTPException(status_code=401, detail="Invalid auth scheme")
-        payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-        email = payload.get("sub")
-        if not email:
-            raise HTTPException(status_code=401, detail="Invalid token payload")
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid token")
+def _classes_etag(joined, created):
+    # (id, rev) of the classes in each list, order-free
+    def pairs(docs):
+        return sorted({(str(c["_id"]), rev_of(c)) for c in docs})
+    return make_etag("classes", pairs(joined), pairs(created))
 
-    # find user
-    user = users_col.find_one({"email": email})
+@app.get("/classes/my")
+async def get_my_classes(claims: dict = Depends(current_claims), if_none_match: str = Header(None)):
+    # only the two id lists (the cached auth user does not carry them so a
+    # join on another worker is visible right away)
+    user = await users_col.find_one(
+        {"email": claims["sub"]},
+        {"joinedClassrooms": 1, "createdClassrooms": 1},
+    )
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # helper to convert list of ids (strings or ObjectId) -> list[ObjectId]
-    def _to_objectid_list(raw_list):
-        out = []
-        if not raw_list:
-            return out
-        for item in raw_list:
-            # if already ObjectId, keep it
-            if isinstance(item, ObjectId):
-                out.append(item)
-                continue
-            # if looks like string, try convert
-            try:
-                out.append(ObjectId(str(item)))
-            except Exception:
-                # ignore invalid ids (don't crash)
-                continue
-        return out
-
     joined_ids_raw = user.get("joinedClassrooms", []) or []
     created_ids_raw = user.get("createdClassrooms", []) or []
 
-    joined_obj_ids = _to_objectid_list(joined_ids_raw)
-    created_obj_ids = _to_objectid_list(created_ids_raw)
+    joined_obj_ids = to_object_ids(joined_ids_raw)
+    created_obj_ids = to_object_ids(created_ids_raw)
+
+    # conditional poll: compare the class revisions before loading the docs
+    if if_none_match and (joined_obj_ids or created_obj_ids):
+        heads = await classrooms_col.find(
+            {"_id": {"$in": joined_obj_ids + created_obj_ids}}, REV_PROJECTION
+        ).to_list(None)
+        joined_set, created_set = set(joined_obj_ids), set(created_obj_ids)
+        etag = _classes_etag(
+            [h for h in heads if h["_id"] in joined_set],
+            [h for h in heads if h["_id"] in created_set],
+        )
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
 
     # fetch docs (only query if list non-empty)
     joined_classes = []
     created_classes = []
 
     if joined_obj_ids:
-        joined_classes = list(classrooms_col.find({"_id": {"$in": joined_obj_ids}}, {"students": 0}))
+        joined_classes = await classrooms_col.find({"_id": {"$in": joined_obj_ids}}, {"students": 0}).to_list(None)
     if created_obj_ids:
-        created_classes = list(classrooms_col.find({"_id": {"$in": created_obj_ids}}, {"students": 0}))
+        created_classes = await classrooms_col.find({"_id": {"$in": created_obj_ids}}, {"students": 0}).to_list(None)
 
-    # convert ObjectId to string for JSON
-    for c in joined_classes:
-        c["_id"] = str(c["_id"])
-    for c in created_classes:
-        c["_id"] = str(c["_id"])
+    # rev is read for the ETag only, it is not part of the payload
+    etag = _classes_etag(joined_classes, created_classes)
+    drop_rev(*joined_classes, *created_classes)
 
-    return {"success": True, "joined": joined_classes, "created": created_classes}
+    # returned as-is: ObjectIds / datetimes are rendered by FastJSONResponse
+    response = FastJSONResponse({"success": True, "joined": joined_classes, "created": created_classes})
+    set_etag(response, etag)
+    return response
 
 # this fetch the data from the classroom and saves in user db at joinedclass=[]
 @app.post("/class/join")
@@ -369,30 +523,17 @@ async def join_classroom(data: JoinClassRequest, authorization: str = Header(Non
     try:
         print("DEBUG /class/join - payload:", data.dict())
 
-        if not authorization:
-            return {"success": False, "message": "Missing Authorization header"}
-
-        # validate token
+        # validate token + find user
         try:
-            scheme, token = authorization.split()
-            if scheme.lower() != "bearer":
-                return {"success": False, "message": "Invalid auth scheme"}
-            payload = decode_token(token)
-            email = payload.get("sub")
-            if not email:
-                return {"success": False, "message": "Invalid token payload"}
-        except Exception as e:
+            user = await authenticate(authorization)
+        except AuthError as e:
             print("DEBUG token error:", e)
-            return {"success": False, "message": "Invalid token"}
-
-        # find user
-        user = users_col.find_one({"email": email})
-        if not user:
-            return {"success": False, "message": "User not found"}
+            return {"success": False, "message": e.message}
+        email = user["email"]
 
         # find classroom by code (case-insensitive)
         code = data.classCode.strip()
-        classroom = classrooms_col.find_one({"classCode": code})
+        classroom = await classrooms_col.find_one({"classCode": code})
         if not classroom:
             return {"success": False, "message": "Classroom not found"}
 
@@ -401,17 +542,22 @@ async def join_classroom(data: JoinClassRequest, authorization: str = Header(Non
         class_id_str = str(classroom["_id"])
 
         # add user to classroom.students (avoid duplicates) and push class id to user's joinedClassrooms
-        classrooms_col.update_one(
+        await classrooms_col.update_one(
             {"_id": classroom["_id"]},
-            {"$addToSet": {"students": user_id_str}}
+            {"$addToSet": {"students": user_id_str}, **REV_BUMP}
         )
-        users_col.update_one(
+        await users_col.update_one(
             {"email": email},
-            {"$addToSet": {"joinedClassrooms": class_id_str}}
+            {"$addToSet": {"joinedClassrooms": class_id_str}, **REV_BUMP}
         )
 
+        invalidate_user(email)
+
+        # patch the cached face gallery of this class (if built already)
+        await galleries.add_student(class_id_str, user_id_str)
+
         # re-fetch classroom to return fresh data (excluding students if you prefer)
-        classroom_fresh = classrooms_col.find_one({"_id": classroom["_id"]})
+        classroom_fresh = await classrooms_col.find_one({"_id": classroom["_id"]})
         classroom_fresh["_id"] = str(classroom_fresh["_id"])
         # optionally remove students array or convert entries if needed
         return {"success": True, "message": "Joined classroom", "classroom": classroom_fresh}
@@ -441,48 +587,47 @@ class ImagePayload(BaseModel):
 # /class/${id}`  1st path check done
 # GET /class/{class_id}  -> returns classroom meta (for teacher/student)
 # GET /class/{class_id} -> returns classroom meta + student attendance
-@app.get("/class/{class_id}")
-async def get_classroom(class_id: str, authorization: str = Header(None)):
-    if not authorization:
-        raise HTTPException(401, "Missing token")
+def _class_etag(classroom, student_id, total_sessions, present_sessions):
+    return make_etag("class", str(classroom["_id"]), rev_of(classroom), student_id,
+                     total_sessions, present_sessions)
 
-    # ---------------- TOKEN CHECK ----------------
-    try:
-        scheme, token = authorization.split()
-        payload = decode_token(token)
-        email = payload["sub"]
-    except:
-        raise HTTPException(401, "Invalid token")
-
-    # ---------------- USER FETCH ----------------
-    user = users_col.find_one({"email": email})
-    if not user:
-        raise HTTPException(404, "User not found")
+@app.get("/class/{class_id}")
+async def get_classroom(
+    class_id: str,
+    user: dict = Depends(current_user),
+    if_none_match: str = Header(None),
+):
+    student_id = str(user["_id"])
+
+    async def _counts():
+        # materialized counters, only this student's entry is read
+        total, attended = await class_attendance_counts(class_id, [student_id])
+        return total, attended.get(student_id, 0)
+
+    # conditional poll: classroom revision + this student's counters only
+    counts = None
+    if if_none_match:
+        head = await classrooms_col.find_one({"_id": ObjectId(class_id)}, REV_PROJECTION)
+        if not head:
+            raise HTTPException(404, "Classroom not found")
+        counts = await _counts()
+        etag = _class_etag(head, student_id, *counts)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
 
     # ---------------- CLASSROOM FETCH ----------------
-    classroom = classrooms_col.find_one({"_id": ObjectId(class_id)})
+    classroom = await classrooms_col.find_one({"_id": ObjectId(class_id)})
     if not classroom:
         raise HTTPException(404, "Classroom not found")
 
-    # Convert _id for frontend
-    classroom["_id"] = str(classroom["_id"])
-
     # ---------------- ATTENDANCE CALCULATION ----------------
-    total_sessions = attendance_col.count_documents({
-        "class_id": ObjectId(class_id)
-    })
-
-    present_sessions = attendance_col.count_documents({
-        "class_id": ObjectId(class_id),
-        "student_id": user["_id"],
-        "present": True
-    })
+    total_sessions, present_sessions = counts or await _counts()
+    percentage = percent(present_sessions, total_sessions)
+    etag = _class_etag(classroom, student_id, total_sessions, present_sessions)
+    drop_rev(classroom)
 
-    percentage = 0
-    if total_sessions > 0:
-        percentage = round((present_sessions / total_sessions) * 100)
-
-    return {
+    # the whole roster rides along -> skip jsonable_encoder
+    response = FastJSONResponse({
         "success": True,
         "classroom": classroom,
         "attendance": {
@@ -490,7 +635,9 @@ async def get_classroom(class_id: str, authorization: str = Header(None)):
             "present_days": present_sessions,
             "total_days": total_sessions
         }
-    }
+    })
+    set_etag(response, etag)
+    return response
 # ${API_BASE}/class/${id}/attendance/today
 # GET /class/{class_id}/attendance/today -> returns attendance array for today
 # @app.get("/attendance/today/{class_id}")
@@ -503,25 +650,15 @@ async def get_today_attendance(class_id: str, authorization: str = Header(None))
 
     today_date = today()
 
-    classroom = classrooms_col.find_one({"_id": ObjectId(class_id)})
+    classroom = await classrooms_col.find_one({"_id": ObjectId(class_id)})
     if not classroom:
         return {"success": False, "message": "Classroom not found"}
 
-    student_ids = classroom.get("students", [])
-
+    # one user fetch + one attendance fetch, joined in memory
     result = []
 
-    for sid in student_ids:
-        student = users_col.find_one({"_id": ObjectId(sid)})
-        if not student:
-            continue
-
-        # Fetch attendance record for today
-        rec = attendance_col.find_one({
-            "class_id": ObjectId(class_id),
-            "student_id": ObjectId(sid),
-            "date": today_date
-        })
+    for row in await today_attendance(classroom, today_date):
+        rec = row["record"]
 
         if rec:
             status = "present"
@@ -531,19 +668,19 @@ async def get_today_attendance(class_id: str, authorization: str = Header(None))
             timestamp = None
 
         result.append({
-            "student_id": str(sid),
-            "name": student["name"],
-            "usn": student["usn"],
+            "student_id": row["student_id"],
+            "name": row["name"],
+            "usn": row["usn"],
             "status": status,
             "timestamp": timestamp
         })
 
-    return {
+    return FastJSONResponse({
         "success": True,
         "attendance": result,
         "count_present": sum(1 for r in result if r["status"] == "present"),
         "count_total": len(result)
-    }
+    })
 
 # ${API_BASE}/class/${id}/attendance/summary
 
@@ -555,25 +692,12 @@ async def publish_notice(class_id: str, payload: dict = Body(...), authorization
     """
     payload expected: { "notice": "text to publish" }
     """
-    if not authorization:
-        return {"success": False, "message": "Missing Authorization header"}
-
     try:
-        scheme, token = authorization.split()
-        if scheme.lower() != "bearer":
-            return {"success": False, "message": "Bad auth scheme"}
-        token_payload = decode_token(token)
-        email = token_payload.get("sub")
-        if not email:
-            return {"success": False, "message": "Invalid token"}
-    except Exception as e:
-        return {"success": False, "message": "Invalid token"}
+        user = await authenticate(authorization)
+    except AuthError as e:
+        return {"success": False, "message": e.message}
 
     try:
-        user = users_col.find_one({"email": email})
-        if not user:
-            return {"success": False, "message": "User not found"}
-
         notice_text = (payload.get("notice") or "").strip()
         if not notice_text:
             return {"success": False, "message": "Empty notice"}
@@ -586,11 +710,13 @@ async def publish_notice(class_id: str, payload: dict = Body(...), authorization
         }
 
         # store notice into classroom doc (overwrite latest notice)
-        classrooms_col.update_one(
+        await classrooms_col.update_one(
             {"_id": ObjectId(class_id)},
-            {"$set": {"notice": notice_obj}}
+            {"$set": {"notice": notice_obj}, **REV_BUMP}
         )
 
+        await live.send(class_id, "notice", {"notice": notice_obj})
+
         # return the saved notice (converted)
         # re-fetch classroom to return updated notice if you want
         return {"success": True, "notice": notice_obj}
@@ -605,42 +731,16 @@ async def publish_notice(class_id: str, payload: dict = Body(...), authorization
 @app.get("/class/{class_id}/report/summary")
 async def report_summary(class_id: str):
 
-    classroom = classrooms_col.find_one({"_id": ObjectId(class_id)})
+    classroom = await classrooms_col.find_one({"_id": ObjectId(class_id)})
     if not classroom:
         raise HTTPException(404, "Class not found")
 
-    student_ids = classroom.get("students", [])
-
-    output = StringIO()
-    writer = csv.writer(output)
-
-    # HEADER
-    # writer.writerow(["College Name: XYZ COLLEGE"])
-    writer.writerow([f"College Name: {classroom.get('collegeName')}"])
-    writer.writerow([f"Department: {classroom.get('department')}"])
-    writer.writerow([f"Semester: {classroom.get('semester')}  Section: {classroom.get('section')}"])
-    writer.writerow([f"Subject: {classroom.get('subjectName')}"])
-    writer.writerow([f"Class Code: {classroom.get('courseCode')}"])
-    writer.writerow([])
-
-    writer.writerow(["Full Attendance Report"])
-    writer.writerow(["Sl.No", "USN", "Name", "Classes Taken", "Classes Attended", "Percentage"])
-
-    for i, sid in enumerate(student_ids, 1):
-        stu = users_col.find_one({"_id": ObjectId(sid)})
-        total = attendance_col.count_documents({"class_id": ObjectId(class_id)})
-        attended = attendance_col.count_documents({
-            "class_id": ObjectId(class_id),
-            "student_id": ObjectId(sid),
-            "present": True
-        })
-        percent = round((attended / total)*100) if total > 0 else 0
-
-        writer.writerow([i, stu["usn"], stu["name"], total, attended, percent])
-
-    output.seek(0)
-    return StreamingResponse(output, media_type="text/csv",
-                             headers={"Content-Disposition": "attachment; filename=summary_report.csv"})
+    header = report_header(
+        classroom,
+        "Full Attendance Report",
+        ["Sl.No", "USN", "Name", "Classes Taken", "Classes Attended", "Percentage"],
+    )
+    return csv_response(stream_csv(header, summary_batches(classroom)), "summary_report.csv")
 
 # dowloads the all present + absent
 @app.get("/class/{class_id}/present/report/today")
@@ -649,68 +749,13 @@ async def report_today(class_id: str):
     today_date = today()
 
     # fetch classroom
-    classroom = classrooms_col.find_one({"_id": ObjectId(class_id)})
+    classroom = await classrooms_col.find_one({"_id": ObjectId(class_id)})
     if not classroom:
         raise HTTPException(404, "Class not found")
 
-    student_ids = classroom.get("students", [])
-
-    # prepare CSV writer
-    output = StringIO()
-    writer = csv.writer(output)
-
-    # HEADER
-    # writer.writerow(["College Name: XYZ COLLEGE"])
-    writer.writerow([f"College Name: {classroom.get('collegeName')}"])
-    writer.writerow([f"Department: {classroom.get('department')}"])
-    writer.writerow([f"Semester: {classroom.get('semester')}  Section: {classroom.get('section')}"])
-    writer.writerow([f"Subject: {classroom.get('subjectName')}"])
-    writer.writerow([f"Class Code: {classroom.get('courseCode')}"])
-    writer.writerow([])
-
-    writer.writerow(["Today's Attendance"])
-    writer.writerow(["Sl.No", "USN", "Name", "Status", "Seen At"])
-
     # loop through ALL students, not only present ones
-    for i, sid in enumerate(student_ids, 1):
-        sid_obj = ObjectId(sid)
-        stu = users_col.find_one({"_id": sid_obj})
-
-        if not stu:
-            continue
-
-        # Check if attendance exists
-        rec = attendance_col.find_one({
-            "class_id": ObjectId(class_id),
-            "student_id": sid_obj,
-            "date": today_date
-        })
-
-        if rec:
-            status = "Present"
-            timestamp = rec.get("createdAt") or rec.get("timestamp")
-            if timestamp:
-                timestamp = timestamp.strftime("%I:%M:%S %p")
-            else:
-                timestamp = "-"
-        else:
-            status = "Absent"
-            timestamp = "-"
-
-        writer.writerow([
-            i,
-            stu.get("usn"),
-            stu.get("name"),
-            status,
-            timestamp
-        ])
-
-    output.seek(0)
-    return StreamingResponse(
-        output,
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=today_attendance.csv"}
-    )
+    header = report_header(classroom, "Today's Attendance", ["Sl.No", "USN", "Name", "Status", "Seen At"])
+    return csv_response(stream_csv(header, roster_day_batches(classroom, today_date)), "today_attendance.csv")
 
 @app.get("/class/{class_id}/report/today")
 async def report_today(class_id: str):
@@ -718,206 +763,386 @@ async def report_today(class_id: str):
     today_date = today()
 
     # fetch classroom
-    classroom = classrooms_col.find_one({"_id": ObjectId(class_id)})
+    classroom = await classrooms_col.find_one({"_id": ObjectId(class_id)})
     if not classroom:
         raise HTTPException(404, "Class not found")
 
-    # fetch attendance of today
-    records = list(attendance_col.find({
-        "class_id": ObjectId(class_id),
-        "date": today_date
-    }))
-
-    # prepare CSV stream
-    output = StringIO()
-    writer = csv.writer(output)
-
-    # HEADER
-    # writer.writerow(["College Name: XYZ COLLEGE"])
-    writer.writerow([f"College Name: {classroom.get('collegeName')}"])
-    writer.writerow([f"Department: {classroom.get('department')}"])
-    writer.writerow([f"Semester: {classroom.get('semester')}  Section: {classroom.get('section')}"])
-    writer.writerow([f"Subject: {classroom.get('subjectName')}"])
-    writer.writerow([f"Class Code: {classroom.get('courseCode')}"])
-    writer.writerow([])
-
-    # TITLE
-    writer.writerow(["Today's Attendance"])
-    writer.writerow(["Sl.No", "USN", "Name", "Status", "Seen At"])
-
-    # data rows
-    for i, rec in enumerate(records, 1):
-        stu = users_col.find_one({"_id": rec["student_id"]})
-        status = "Present" if rec.get("present") else "Absent"
-
-        # FIXED TIMESTAMP LOGIC
-        raw_ts = rec.get("timestamp") or rec.get("createdAt")
-
-        if raw_ts:
-            try:
-                timestamp = raw_ts.strftime("%I:%M:%S %p")
-            except:
-                timestamp = str(raw_ts)
-        else:
-            timestamp = "-"
-
-        writer.writerow([i, stu["usn"], stu["name"], status, timestamp])
+    # only the records of today, streamed from a server-side cursor
+    header = report_header(classroom, "Today's Attendance", ["Sl.No", "USN", "Name", "Status", "Seen At"])
+    return csv_response(stream_csv(header, seen_day_batches(classroom, today_date)), "today_attendance.csv")
+
+# bulk export: many classes (ids or department/semester) over a date range
+class ExportRequest(BaseModel):
+    classIds: List[str] = []
+    department: Optional[str] = None
+    semester: Optional[int] = None
+    dateFrom: str            # YYYY-MM-DD
+    dateTo: str              # YYYY-MM-DD
+    format: str = "csv"      # csv | parquet | arrow
+
+@app.post("/reports/export")
+async def bulk_export(data: ExportRequest, user: dict = Depends(current_user)):
+    try:
+        date_from = _iso_date(datetime.strptime(data.dateFrom, "%Y-%m-%d"))
+        date_to = _iso_date(datetime.strptime(data.dateTo, "%Y-%m-%d"))
+    except ValueError:
+        raise HTTPException(400, "dateFrom/dateTo must be YYYY-MM-DD")
+
+    fmt = data.format.lower()
+    if fmt not in ("csv", "parquet", "arrow"):
+        raise HTTPException(400, "format must be csv, parquet or arrow")
+
+    # which classrooms (only ever the caller's own)
+    owner = str(user["_id"])
+    if data.classIds:
+        query = {"_id": {"$in": [ObjectId(c) for c in data.classIds if ObjectId.is_valid(c)]}}
+    elif data.department:
+        query = {"department": data.department, "createdBy": owner}
+        if data.semester is not None:
+            query["semester"] = data.semester
+    else:
+        raise HTTPException(400, "Give classIds or a department (and semester)")
+
+    classrooms = await classrooms_col.find(query).sort("courseCode", 1).to_list(None)
+    if not classrooms:
+        raise HTTPException(404, "No classrooms matched")
+    if any(c.get("createdBy") != owner for c in classrooms):
+        raise HTTPException(403, "You can only export classes you created")
+
+    export = await AttendanceExport(classrooms, date_from, date_to).load()
+    filename = f"attendance_{date_from}_{date_to}"
+
+    if fmt == "csv":
+        return csv_response(stream_csv([export.columns], export.row_batches()), f"{filename}.csv")
 
-    output.seek(0)
-    return StreamingResponse(
-        output,
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=today_attendance.csv"}
+    try:
+        # building + encoding the table is CPU bound
+        body = await run_in_threadpool(export_bytes, export, fmt)
+    except ImportError:
+        raise HTTPException(501, "pyarrow is not installed on the server")
+    ext = "parquet" if fmt == "parquet" else "arrow"
+    media = "application/vnd.apache.parquet" if fmt == "parquet" else "application/vnd.apache.arrow.stream"
+    return Response(
+        content=body,
+        media_type=media,
+        headers={"Content-Disposition": f"attachment; filename={filename}.{ext}"},
     )
 
+# live "attendance" event: who was seen + their updated summary rows, so
+# dashboards patch in place instead of refetching the whole summary
+async def _send_attendance(classroom, date, present):
+    ids = [m["student_id"] for m in present]
+    sessions, rows = await attendance_deltas(classroom, ids)
+    await live.send(classroom["_id"], "attendance", {
+        "date": date,
+        "seenAt": datetime.utcnow(),
+        "present": present,
+        "sessions": sessions,
+        "summary": rows,
+    })
+
 # -----main photo to attended 
 # ${API}/attendance/face-session
 # the attendance module
-@app.post("/attendance/face-session")
+@vision.post("/attendance/face-session")
 async def attendance_face_session(
     class_id: str = Form(...),
     file: UploadFile = File(...),
+    detector: str = Form(None),
+    upsample: int = Form(None),
+    max_side: int = Form(None),
     authorization: str = Header(None),
 ):
-    # -------- TOKEN CHECK --------
-    if not authorization:
-        return {"success": False, "message": "Missing token"}
+    options = _detect_options(detector, upsample, max_side)
 
+    # -------- TOKEN CHECK --------
     try:
-        scheme, token = authorization.split()
-        payload = decode_token(token)
-        email = payload["sub"]
-    except:
-        return {"success": False, "message": "Invalid token"}
-
-    teacher = users_col.find_one({"email": email})
-    if not teacher:
-        return {"success": False, "message": "Teacher not found"}
+        teacher = await authenticate(authorization)
+    except AuthError as e:
+        if e.status_code == 404:
+            return {"success": False, "message": "Teacher not found"}
+        return {"success": False, "message": e.message}
 
     # -------- CLASSROOM CHECK --------
-    classroom = classrooms_col.find_one({"_id": ObjectId(class_id)})
+    classroom = await classrooms_col.find_one({"_id": ObjectId(class_id)})
     if not classroom:
         return {"success": False, "message": "Classroom not found"}
 
     # -------- READ IMAGE --------
     image_bytes = await file.read()
-    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    detected = face_recognition.face_encodings(np.array(image))
+    try:
+        result = await encoder.encode(image_bytes, options)
+    except PoolBusy as e:
+        raise _busy_response(e)
+    record_stages(result.timings)
+    detected = result.encodings
+    timings = dict(result.timings)
 
     if len(detected) == 0:
-        return {"success": False, "message": "No faces detected"}
-
-    detected_faces = [np.array(d) for d in detected]
+        return {"success": False, "message": "No faces detected", "timings_ms": timings}
 
     # -------- ONLY MATCH STUDENTS JOINED TO THIS CLASS --------
-    present = []
+    # one batched distance computation against the class gallery
+    started = time.perf_counter()
+    with span("gallery_load"):
+        gallery = await galleries.get(classroom)
+    with span("match"):
+        matches = gallery.match(detected, tolerance=MATCH_TOLERANCE)
+    timings["match_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    # -------- WRITE ALL MATCHES IN ONE ROUND TRIP --------
+    present = matches
     today_date = datetime.utcnow().strftime("%Y-%m-%d")
+    started = time.perf_counter()
+    with span("db_write"):
+        session = await open_session(classroom, today_date)
+        await mark_present(class_id, [m["student_id"] for m in present], today_date)
+        await record_present(session, [m["student_id"] for m in present])
+    timings["write_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    if present:
+        await _send_attendance(classroom, today_date, present)
 
-    for sid_str in classroom.get("students", []):
-        sid = ObjectId(sid_str)
-        student = users_col.find_one({"_id": sid})
+    return {
+        "success": True,
+        "present": present,
+        "count": len(present),
+        "sessionId": str(session["_id"]),
+        "detect": _detect_info(result, options),
+        "timings_ms": timings,
+    }
+
+# ---------------------------
+# attendance sessions (one class meeting per date)
+# ---------------------------
+# face sessions open today's session themselves; these let the teacher
+# start it before the first photo and close it after the last one.
+# Only the teacher who created the class may use them.
 
-        if not student:
-            continue
+async def _own_classroom(class_id, user, projection=None):
+    classroom = await classrooms_col.find_one({"_id": ObjectId(class_id)}, {"createdBy": 1, **(projection or {})})
+    if not classroom:
+        raise HTTPException(404, "Classroom not found")
+    if classroom.get("createdBy") != str(user["_id"]):
+        raise HTTPException(403, "Only the class teacher can manage its sessions")
+    return classroom
+
+@app.post("/class/{class_id}/session/start")
+async def start_session(class_id: str, user: dict = Depends(current_user)):
+    classroom = await _own_classroom(class_id, user, {"students": 1})
+    session = await open_session(classroom, today())
+    return {"success": True, "session": session_view(session)}
+
+@app.post("/class/{class_id}/session/finalize")
+async def finalize_class_session(class_id: str, date: str = Query(None), user: dict = Depends(current_user)):
+    await _own_classroom(class_id, user)
+    session = await sessions_col.find_one({"class_id": ObjectId(class_id), "date": date or today()})
+    if not session:
+        raise HTTPException(404, "No session for that date")
+    session = await finalize_session(session)
+    return {"success": True, "session": session_view(session)}
+
+@app.get("/class/{class_id}/sessions")
+async def list_sessions(class_id: str, user: dict = Depends(current_user)):
+    await _own_classroom(class_id, user)
+    cursor = sessions_col.find(
+        {"class_id": ObjectId(class_id)},
+        {"presentIds": 0, "present": 0},
+    ).sort("date", -1)
+    sessions = [session_view(s) async for s in cursor]
+    return {"success": True, "sessions": sessions, "count": len(sessions)}
+
+@app.get("/class/{class_id}/sessions/{date}")
+async def get_session(class_id: str, date: str, user: dict = Depends(current_user)):
+    await _own_classroom(class_id, user)
+    session = await sessions_col.find_one({"class_id": ObjectId(class_id), "date": date})
+    if not session:
+        raise HTTPException(404, "No session for that date")
+    return {"success": True, "session": session_view(session, with_present=True)}
+
+# several photos of the same lecture (different angles) in one request
+@vision.post("/attendance/face-session/batch")
+async def attendance_face_session_batch(
+    class_id: str = Form(...),
+    files: List[UploadFile] = File(...),
+    detector: str = Form(None),
+    upsample: int = Form(None),
+    max_side: int = Form(None),
+    authorization: str = Header(None),
+):
+    options = _detect_options(detector, upsample, max_side)
+    if len(files) > FACE_BATCH_MAX_PHOTOS:
+        raise HTTPException(400, f"At most {FACE_BATCH_MAX_PHOTOS} photos per batch")
 
-        # Student encodings
-        stored_encs = student.get("face_id", {}).get("embeddings", [])
-        if not stored_encs:
-            continue
+    # -------- TOKEN CHECK --------
+    try:
+        await authenticate(authorization)
+    except AuthError as e:
+        if e.status_code == 404:
+            return {"success": False, "message": "Teacher not found"}
+        return {"success": False, "message": e.message}
 
-        matched = False
+    # -------- CLASSROOM CHECK --------
+    classroom = await classrooms_col.find_one({"_id": ObjectId(class_id)})
+    if not classroom:
+        return {"success": False, "message": "Classroom not found"}
 
-        for stu_enc in stored_encs:
-            stu_vec = np.array(stu_enc)
+    # -------- ENCODE ALL PHOTOS IN PARALLEL --------
+    started = time.perf_counter()
+    images = [await f.read() for f in files]
+    try:
+        results = await encoder.encode_many(images, options)
+    except PoolBusy as e:
+        raise _busy_response(e)
+    timings = {"encode_ms": round((time.perf_counter() - started) * 1000, 1)}
+    for result in results:
+        record_stages(result.timings)
+
+    detected, frames = [], []
+    for i, result in enumerate(results):
+        detected.extend(result.encodings)
+        frames.extend([i] * len(result))
+    if not detected:
+        return {"success": False, "message": "No faces detected", "timings_ms": timings}
+
+    # -------- SAME PERSON ACROSS PHOTOS -> ONE FACE, ONE GALLERY MATCH --------
+    started = time.perf_counter()
+    with span("group_faces"):
+        groups = group_faces(detected, frames)
+    with span("gallery_load"):
+        gallery = await galleries.get(classroom)
+    with span("match"):
+        present = gallery.match(detected, tolerance=MATCH_TOLERANCE, groups=groups)
+    timings["match_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    # -------- ONE BULK WRITE --------
+    started = time.perf_counter()
+    today_date = datetime.utcnow().strftime("%Y-%m-%d")
+    with span("db_write"):
+        session = await open_session(classroom, today_date)
+        await mark_present(class_id, [m["student_id"] for m in present], today_date)
+        await record_present(session, [m["student_id"] for m in present])
+    timings["write_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    if present:
+        await _send_attendance(classroom, today_date, present)
 
-            # Compare against each detected face
-            for det in detected_faces:
-                dist = np.linalg.norm(stu_vec - det)
-                if dist <= 0.45:
-                    matched = True
-                    break
+    return {
+        "success": True,
+        "present": present,
+        "count": len(present),
+        "sessionId": str(session["_id"]),
+        "photos": [{"faces": len(r), "timings_ms": r.timings} for r in results],
+        "faces": len(detected),
+        "people": int(groups.max()) + 1,
+        "timings_ms": timings,
+    }
 
-            if matched:
-                break
+# open lab sessions: who is this? (searches every enrolled user, not one class)
+@vision.post("/faces/identify")
+async def identify_faces(
+    file: UploadFile = File(...),
+    k: int = Query(5, ge=1, le=50),
+    detector: str = Query(None),
+    upsample: int = Query(None),
+    max_side: int = Query(None),
+    user: dict = Depends(current_user),
+    x_admin_key: str = Header(None),
+):
+    global _face_index_synced
+    if face_index is None:
+        raise HTTPException(503, "Face index is disabled")
+    # searches every enrolled student: teachers (created a class) or admin only
+    if not (ADMIN_KEY and x_admin_key == ADMIN_KEY):
+        teacher = await users_col.find_one(
+            {"_id": user["_id"], "createdClassrooms.0": {"$exists": True}}, ID_ONLY_PROJECTION
+        )
+        if not teacher:
+            raise HTTPException(403, "Only teachers can identify faces")
+    options = _detect_options(detector, upsample, max_side)
 
-        if matched:
-            present.append({
-                "student_id": str(sid),
-                "name": student["name"],
-                "usn": student["usn"]
-            })
-
-            # Update OR insert today's attendance record
-            attendance_col.update_one(
-                {
-                    "student_id": sid,
-                    "class_id": ObjectId(class_id),
-                    "date": today_date
-                },
-                {
-                    "$set": {
-                        "present": True,
-                        "updatedAt": datetime.utcnow()
-                    }
-                },
-                upsert=True
-            )
+    image_bytes = await file.read()
+    try:
+        result = await encoder.encode(image_bytes, options)
+    except PoolBusy as e:
+        raise _busy_response(e)
+    record_stages(result.timings)
+    detected = result.encodings
+    if len(detected) == 0:
+        return {"success": False, "message": "No faces detected", "timings_ms": result.timings}
+
+    # pick up enrollments handled by other workers
+    if time.monotonic() - _face_index_synced > FACE_INDEX_SYNC_SECONDS:
+        _face_index_synced = time.monotonic()
+        await sync_index(face_index, users_col)
+
+    with span("index_search"):
+        faces = identify(face_index, detected, k=k)
+    # names only for the matches, the other candidates stay anonymous
+    students = await fetch_students({c["student_id"] for top in faces for c in top if c["match"]})
+    for top in faces:
+        for cand in top:
+            if cand["match"]:
+                stu = students.get(cand["student_id"]) or {}
+                cand["name"] = stu.get("name")
+                cand["usn"] = stu.get("usn")
 
     return {
         "success": True,
-        "present": present,
-        "count": len(present)
+        "faces": faces,
+        "count": len(faces),
+        "detect": _detect_info(result, options),
+        "timings_ms": result.timings,
     }
 
 # /API_BASE/class/${id}/attendance/summary
 @app.get("/class/{class_id}/attendance/summary")
 async def attendance_summary(class_id: str, authorization: str = Header(None)):
-    if not authorization:
-        return {"success": False, "message": "Missing token"}
-
     try:
-        scheme, token = authorization.split()
-        payload = decode_token(token)
-    except:
-        return {"success": False, "message": "Invalid token"}
+        verify_token(authorization)
+    except AuthError as e:
+        return {"success": False, "message": e.message}
 
-    classroom = classrooms_col.find_one({"_id": ObjectId(class_id)})
+    classroom = await classrooms_col.find_one({"_id": ObjectId(class_id)})
     if not classroom:
         return {"success": False, "message": "Classroom not found"}
 
-    student_ids = classroom.get("students", [])
-
-    summary = []
-    
-    for sid in student_ids:
-        student = users_col.find_one({"_id": ObjectId(sid)})
-        if not student:
-            continue
-        
-        total = attendance_col.count_documents({
-            "class_id": ObjectId(class_id)
-        })
-
-        attended = attendance_col.count_documents({
-            "class_id": ObjectId(class_id),
-            "student_id": ObjectId(sid),
-            "present": True
-        })
-
-        percent = round((attended / total) * 100) if total > 0 else 0
-        eligible = percent >= (classroom.get("minAttendance") or 0)
-
-        summary.append({
-            "usn": student["usn"],
-            "name": student["name"],
-            "percentage": percent,
-            "eligible": eligible
-        })
+    rows = await class_attendance_summary(classroom)
+    summary = [
+        {
+            "student_id": row["student_id"],
+            "usn": row["usn"],
+            "name": row["name"],
+            "attended": row["attended"],
+            "percentage": row["percentage"],
+            "eligible": row["eligible"],
+        }
+        for row in rows
+    ]
 
-    return {
+    return FastJSONResponse({
         "success": True,
+        # classes taken; a live event with another count means a new meeting
+        "sessions": rows[0]["total"] if rows else 0,
         "summary": summary
-    }
+    })
+
+
+# ---------------------------
+# face endpoints: served here or offloaded to the vision tier
+# ---------------------------
+async def _offload_to_vision(request: Request):
+    if not VISION_URL:
+        raise HTTPException(503, "Face endpoints are served by the vision workers")
+    url = VISION_URL + request.url.path
+    if request.url.query:
+        url += "?" + request.url.query
+    # 307 keeps the method and the body
+    return RedirectResponse(url, status_code=307)
+
+if VISION_ENABLED:
+    app.include_router(vision)
+else:
+    for route in vision.routes:
+        app.add_api_route(route.path, _offload_to_vision, methods=list(route.methods), include_in_schema=False)
 
 
 # ---------------------------
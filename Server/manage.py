@@ -0,0 +1,220 @@
+import argparse
+import asyncio
+import json
+from datetime import datetime
+
+# ---------------------------
+# maintenance commands
+#   python manage.py ensure-indexes
+#   python manage.py audit-indexes
+#   python manage.py face-index rebuild|check
+#   python manage.py counters verify|rebuild [--class-id ID]
+#   python manage.py embeddings migrate [--dtype float16] [--dry-run]
+#   python manage.py embeddings consolidate [--max-templates 5] [--dry-run]
+# ---------------------------
+
+
+def cmd_ensure_indexes(args):
+    from db import ensure_indexes
+    print(json.dumps(asyncio.run(ensure_indexes()), indent=2))
+
+
+def cmd_audit_indexes(args):
+    from db import audit_indexes
+    report = asyncio.run(audit_indexes())
+    for row in report:
+        flag = "COLLSCAN" if row["collscan"] else "ok"
+        print(f"{flag:9} {row['collection']:12} {row['query']:30} {' > '.join(row['plan'])}")
+    # non-zero exit so CI / cron can alert on a missing index
+    return 1 if any(r["collscan"] for r in report) else 0
+
+
+def cmd_face_index(args):
+    import numpy as np
+    from db import users_col
+    from face_index import FaceIndex, load_from_mongo, FACE_INDEX_PATH
+
+    async def _items():
+        items, newest = [], None
+        async for user_id, embs, enrolled in load_from_mongo(users_col):
+            items.append((user_id, embs))
+            if enrolled and (newest is None or enrolled > newest):
+                newest = enrolled
+        return items, newest
+
+    items, newest = asyncio.run(_items())
+    index = FaceIndex().build(items)
+    index.synced_at = newest
+    print(f"{len(index)} users, {index.rows} vectors, "
+          f"{0 if index.centroids is None else len(index.centroids)} cells")
+
+    if args.action == "rebuild":
+        path = args.path or FACE_INDEX_PATH
+        index.save(path)
+        print("saved", path)
+        return 0
+
+    # check: stored vectors + noise as queries, top-1 vs brute force
+    if not index.rows:
+        return 0
+    rng = np.random.default_rng(0)
+    rows = rng.choice(index.rows, size=min(args.queries, index.rows), replace=False)
+    queries = index.vectors[rows] + rng.normal(0, 0.02, (len(rows), index.vectors.shape[1]))
+    recall = index.recall(queries, k=1)
+    print(f"recall@1 vs brute force: {recall:.4f} (nprobe={index.nprobe})")
+    return 0 if recall >= args.min_recall else 1
+
+
+def cmd_counters(args):
+    from db import classrooms_col
+    from attendance import rebuild_counters, verify_counters
+
+    async def _run():
+        if args.class_id:
+            class_ids = [args.class_id]
+        else:
+            class_ids = [c["_id"] async for c in classrooms_col.find({}, {"_id": 1})]
+        bad = 0
+        for class_id in class_ids:
+            diff = await verify_counters(class_id)
+            if diff is None:
+                continue
+            bad += 1
+            print(f"mismatch {class_id}: stored={diff['stored']} raw={diff['raw']}")
+            if args.action == "rebuild":
+                await rebuild_counters(class_id)
+        print(f"{len(class_ids)} classes, {bad} mismatched" + (", rebuilt" if bad and args.action == "rebuild" else ""))
+        return bad
+
+    bad = asyncio.run(_run())
+    return 1 if bad and args.action == "verify" else 0
+
+
+def cmd_embeddings(args):
+    if args.action == "consolidate":
+        return consolidate_embeddings(args)
+
+    import bson
+    from pymongo import UpdateOne
+    from db import users_col
+    from embeddings import pack_embeddings, unpack_embeddings
+
+    async def _run():
+        # legacy documents still hold a BSON array
+        cursor = users_col.find({"face_id.embeddings": {"$type": "array"}}, {"face_id.embeddings": 1})
+        ops, seen, before, after = [], 0, 0, 0
+        async for doc in cursor:
+            legacy = doc["face_id"]["embeddings"]
+            arr = unpack_embeddings(legacy)
+            if arr is None:
+                continue
+            blob = pack_embeddings(arr, dtype=args.dtype)
+            seen += 1
+            before += len(bson.encode({"e": legacy}))
+            after += len(bson.encode({"e": blob}))
+            # only replace what we read (a re-enrollment in between wins)
+            ops.append(UpdateOne(
+                {"_id": doc["_id"], "face_id.embeddings": legacy},
+                {"$set": {"face_id.embeddings": blob}},
+            ))
+            if len(ops) >= args.batch and not args.dry_run:
+                await users_col.bulk_write(ops, ordered=False)
+                ops = []
+        if ops and not args.dry_run:
+            await users_col.bulk_write(ops, ordered=False)
+        return seen, before, after
+
+    seen, before, after = asyncio.run(_run())
+    verb = "would convert" if args.dry_run else "converted"
+    print(f"{verb} {seen} users: {before} -> {after} bytes of embeddings")
+    return 0
+
+
+def consolidate_embeddings(args):
+    # backfill: users enrolled before templates were consolidated at signup
+    from pymongo import UpdateOne
+    from db import users_col
+    from embeddings import pack_embeddings, unpack_embeddings
+    from etag import REV_BUMP
+    from face_service import consolidate_templates, MAX_TEMPLATES, TEMPLATE_VERSION
+
+    async def _run():
+        cursor = users_col.find(
+            {"face_id.embeddings": {"$exists": True, "$nin": [None, []]},
+             "face_id.templates": {"$ne": TEMPLATE_VERSION}},
+            {"face_id.embeddings": 1},
+        )
+        ops, users, before, after, outliers = [], 0, 0, 0, 0
+        async for doc in cursor:
+            stored = doc["face_id"]["embeddings"]
+            arr = unpack_embeddings(stored)
+            if arr is None:
+                continue
+            templates, stats = consolidate_templates(arr, max_templates=args.max_templates or MAX_TEMPLATES)
+            if len(templates) == 0:
+                print(f"skip {doc['_id']}: no usable embeddings")
+                continue
+            users += 1
+            before += stats["samples"]
+            after += stats["templates"]
+            outliers += stats["outliers"]
+            # only replace what we read (a re-enrollment in between wins)
+            ops.append(UpdateOne(
+                {"_id": doc["_id"], "face_id.embeddings": stored},
+                # a new enrolledAt makes running workers reload the user
+                # (face index sync, cached class galleries), rev drops
+                # cached /me ETags
+                {"$set": {"face_id.embeddings": pack_embeddings(templates, dtype=args.dtype),
+                          "face_id.templates": TEMPLATE_VERSION,
+                          "face_id.enrolledAt": datetime.utcnow()},
+                 **REV_BUMP},
+            ))
+            if len(ops) >= args.batch and not args.dry_run:
+                await users_col.bulk_write(ops, ordered=False)
+                ops = []
+        if ops and not args.dry_run:
+            await users_col.bulk_write(ops, ordered=False)
+        return users, before, after, outliers
+
+    users, before, after, outliers = asyncio.run(_run())
+    verb = "would consolidate" if args.dry_run else "consolidated"
+    print(f"{verb} {users} users: {before} -> {after} vectors ({outliers} outlier samples dropped)")
+    return 0
+
+
+COMMANDS = {
+    "ensure-indexes": cmd_ensure_indexes,
+    "audit-indexes": cmd_audit_indexes,
+    "face-index": cmd_face_index,
+    "counters": cmd_counters,
+    "embeddings": cmd_embeddings,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classroom backend maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("ensure-indexes", help="create the declared MongoDB indexes")
+    sub.add_parser("audit-indexes", help="explain() every query shape, flag COLLSCAN")
+    face = sub.add_parser("face-index", help="rebuild the campus face index or check its recall")
+    face.add_argument("action", choices=["rebuild", "check"])
+    face.add_argument("--path", default=None, help="index file (default FACE_INDEX_PATH)")
+    face.add_argument("--queries", type=int, default=500)
+    face.add_argument("--min-recall", type=float, default=0.99)
+    counters = sub.add_parser("counters", help="check / rebuild the attendance counters from the raw rows")
+    counters.add_argument("action", choices=["verify", "rebuild"])
+    counters.add_argument("--class-id", default=None, help="only this classroom")
+    embs = sub.add_parser("embeddings", help="pack legacy list embeddings / consolidate enrollment templates")
+    embs.add_argument("action", choices=["migrate", "consolidate"])
+    embs.add_argument("--dtype", choices=["float32", "float16"], default=None,
+                      help="blob dtype (default EMBEDDING_STORE_DTYPE)")
+    embs.add_argument("--batch", type=int, default=500)
+    embs.add_argument("--max-templates", type=int, default=None,
+                      help="templates per user for consolidate (default FACE_MAX_TEMPLATES)")
+    embs.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+    return COMMANDS[args.command](args) or 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
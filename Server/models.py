@@ -0,0 +1,85 @@
+from datetime import datetime
+from typing import List, Optional
+
+from bson import ObjectId
+from pydantic import BaseModel
+
+# ---------------------------
+# user views + projections
+# ---------------------------
+# the user document carries face_id.embeddings (several 128-float vectors,
+# packed into one binary blob -- see embeddings.py).
+# Only enrollment and face matching need them; every other read uses one of
+# these projections so the vectors never cross the wire or get decoded.
+
+# login: only what is needed to check the password
+LOGIN_PROJECTION = {"name": 1, "email": 1, "password": 1, "password_hash": 1}
+
+# existence checks
+ID_ONLY_PROJECTION = {"_id": 1}
+
+# roster rows of reports / summaries
+STUDENT_ROW_PROJECTION = {"name": 1, "usn": 1}
+
+# the authenticated caller (cached by auth.py)
+SLIM_USER_PROJECTION = {"name": 1, "email": 1, "usn": 1}
+
+# profile returned by /me
+USER_VIEW_PROJECTION = {
+    "name": 1,
+    "email": 1,
+    "usn": 1,
+    "joinedClassrooms": 1,
+    "createdClassrooms": 1,
+    "createdAt": 1,
+    "face_id.enrolledAt": 1,
+    "rev": 1,               # ETag version (etag.py), not part of the view
+}
+
+
+# ids from request bodies / rosters; the one conversion helper (no db import,
+# so face_service and the offline benches can use it)
+def to_object_ids(raw_ids):
+    """str / ObjectId list -> ObjectId list (invalid ids are skipped)."""
+    out = []
+    for item in raw_ids or []:
+        if isinstance(item, ObjectId):
+            out.append(item)
+            continue
+        try:
+            out.append(ObjectId(str(item)))
+        except Exception:
+            continue
+    return out
+
+
+class UserView(BaseModel):
+    """Public profile of a user (no password, no embeddings)."""
+
+    id: str
+    name: Optional[str] = None
+    email: Optional[str] = None
+    usn: Optional[str] = None
+    joinedClassrooms: List[str] = []
+    createdClassrooms: List[str] = []
+    createdAt: Optional[datetime] = None
+    faceEnrolledAt: Optional[datetime] = None
+
+    @classmethod
+    def from_doc(cls, doc):
+        return cls(
+            id=str(doc["_id"]),
+            name=doc.get("name"),
+            email=doc.get("email"),
+            usn=doc.get("usn"),
+            joinedClassrooms=[str(c) for c in doc.get("joinedClassrooms") or []],
+            createdClassrooms=[str(c) for c in doc.get("createdClassrooms") or []],
+            createdAt=doc.get("createdAt"),
+            faceEnrolledAt=(doc.get("face_id") or {}).get("enrolledAt"),
+        )
+
+    def to_json(self):
+        # keep the "_id" key the client already reads
+        data = self.model_dump()
+        data["_id"] = data.pop("id")
+        return data
@@ -0,0 +1,284 @@
+import csv
+import os
+from io import BytesIO, StringIO
+
+from bson import ObjectId
+from fastapi.responses import StreamingResponse
+
+from db import attendance_col, sessions_col
+from attendance import class_attendance_counts, fetch_students, percent
+from models import to_object_ids
+
+# ---------------------------
+# streaming CSV reports
+# ---------------------------
+# rows are produced batch by batch (roster chunks / server-side cursor
+# batches) and written out as soon as they are ready, so the first byte
+# goes out immediately and memory does not grow with the class size.
+
+REPORT_BATCH_SIZE = int(os.getenv("REPORT_BATCH_SIZE", "500"))
+
+
+def _csv_text(rows):
+    buf = StringIO()
+    csv.writer(buf).writerows(rows)
+    return buf.getvalue()
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _seen_at(rec):
+    raw_ts = rec.get("timestamp") or rec.get("createdAt")
+    if not raw_ts:
+        return "-"
+    try:
+        return raw_ts.strftime("%I:%M:%S %p")
+    except Exception:
+        return str(raw_ts)
+
+
+def report_header(classroom, title, columns):
+    """Header block shared by every class report."""
+    return [
+        [f"College Name: {classroom.get('collegeName')}"],
+        [f"Department: {classroom.get('department')}"],
+        [f"Semester: {classroom.get('semester')}  Section: {classroom.get('section')}"],
+        [f"Subject: {classroom.get('subjectName')}"],
+        [f"Class Code: {classroom.get('courseCode')}"],
+        [],
+        [title],
+        columns,
+    ]
+
+
+async def stream_csv(header, batches):
+    """header rows first, then one CSV chunk per batch of rows."""
+    yield _csv_text(header)
+    async for batch in batches:
+        if batch:
+            yield _csv_text(batch)
+
+
+def csv_response(body, filename):
+    return StreamingResponse(
+        body,
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+# ---------- row producers (async generators of row batches) ----------
+async def summary_batches(classroom):
+    """Sl.No, USN, Name, Classes Taken, Classes Attended, Percentage"""
+    class_id = ObjectId(classroom["_id"])
+    roster = [str(s) for s in classroom.get("students", [])]
+    total, attended = await class_attendance_counts(class_id)
+
+    n = 0
+    for ids in _chunks(roster, REPORT_BATCH_SIZE):
+        students = await fetch_students(ids)
+        batch = []
+        for sid in ids:
+            stu = students.get(sid)
+            if not stu:
+                continue
+            n += 1
+            present = attended.get(sid, 0)
+            batch.append([n, stu.get("usn"), stu.get("name"), total, present, percent(present, total)])
+        yield batch
+
+
+async def roster_day_batches(classroom, date):
+    """Every student of the roster with Present/Absent for one date."""
+    class_id = ObjectId(classroom["_id"])
+    roster = [str(s) for s in classroom.get("students", [])]
+
+    n = 0
+    for ids in _chunks(roster, REPORT_BATCH_SIZE):
+        students = await fetch_students(ids)
+        cursor = attendance_col.find(
+            {"class_id": class_id, "date": date, "student_id": {"$in": to_object_ids(ids)}},
+            {"student_id": 1, "present": 1, "timestamp": 1, "createdAt": 1},
+        )
+        records = {str(r["student_id"]): r async for r in cursor}
+        batch = []
+        for sid in ids:
+            stu = students.get(sid)
+            if not stu:
+                continue
+            n += 1
+            rec = records.get(sid)
+            if rec:
+                batch.append([n, stu.get("usn"), stu.get("name"), "Present", _seen_at(rec)])
+            else:
+                batch.append([n, stu.get("usn"), stu.get("name"), "Absent", "-"])
+        yield batch
+
+
+async def seen_day_batches(classroom, date):
+    """Only the attendance rows recorded for one date (server-side cursor)."""
+    cursor = attendance_col.find(
+        {"class_id": ObjectId(classroom["_id"]), "date": date},
+        {"student_id": 1, "present": 1, "timestamp": 1, "createdAt": 1},
+        batch_size=REPORT_BATCH_SIZE,
+    )
+
+    n = 0
+    records = []
+    async for rec in cursor:
+        records.append(rec)
+        if len(records) >= REPORT_BATCH_SIZE:
+            batch, n = await _seen_rows(records, n)
+            records = []
+            yield batch
+    if records:
+        batch, n = await _seen_rows(records, n)
+        yield batch
+
+
+async def _seen_rows(records, n):
+    students = await fetch_students([r["student_id"] for r in records])
+    rows = []
+    for rec in records:
+        stu = students.get(str(rec["student_id"]))
+        if not stu:
+            continue
+        n += 1
+        status = "Present" if rec.get("present") else "Absent"
+        rows.append([n, stu.get("usn"), stu.get("name"), status, _seen_at(rec)])
+    return rows, n
+
+
+# ---------------------------
+# bulk (multi-class, date range) export
+# ---------------------------
+# a whole department/semester is computed with two aggregations over the
+# attendance collection + one user lookup, instead of one report call per
+# class. Each row is a student of a class with one P/A column per date.
+
+EXPORT_FIXED_COLUMNS = ["Class Code", "Subject", "Section", "Semester", "USN", "Name"]
+EXPORT_TOTAL_COLUMNS = ["Classes Taken", "Classes Attended", "Percentage"]
+
+
+class AttendanceExport:
+    """Presence data of several classrooms over a date range."""
+
+    def __init__(self, classrooms, date_from, date_to):
+        self.classrooms = classrooms
+        self.date_from = date_from
+        self.date_to = date_to
+        self.sessions = {}      # class_id -> set of dates the class met
+        self.presence = {}      # (class_id, student_id) -> set of present dates
+        self.students = {}      # student_id -> {name, usn}
+        self.dates = []         # union of all session dates, sorted
+
+    async def load(self):
+        class_ids = [ObjectId(c["_id"]) for c in self.classrooms]
+        match = {
+            "class_id": {"$in": class_ids},
+            "date": {"$gte": self.date_from, "$lte": self.date_to},
+        }
+
+        # 1) which dates each class met: its sessions, plus the dates of
+        #    rows written before sessions existed (same as raw_attendance_counts)
+        for col in (sessions_col, attendance_col):
+            cursor = await col.aggregate([
+                {"$match": match},
+                {"$group": {"_id": "$class_id", "dates": {"$addToSet": "$date"}}},
+            ], allowDiskUse=True)
+            async for row in cursor:
+                self.sessions.setdefault(str(row["_id"]), set()).update(row["dates"])
+
+        # 2) present dates per (class, student)
+        cursor = await attendance_col.aggregate([
+            {"$match": dict(match, present=True)},
+            {"$group": {
+                "_id": {"c": "$class_id", "s": "$student_id"},
+                "dates": {"$addToSet": "$date"},
+            }},
+        ], allowDiskUse=True)
+        async for row in cursor:
+            self.presence[(str(row["_id"]["c"]), str(row["_id"]["s"]))] = set(row["dates"])
+
+        # 3) one user lookup for every roster
+        roster = {str(s) for c in self.classrooms for s in c.get("students", [])}
+        self.students = await fetch_students(list(roster))
+
+        self.dates = sorted(set().union(*self.sessions.values())) if self.sessions else []
+        return self
+
+    @property
+    def columns(self):
+        return EXPORT_FIXED_COLUMNS + self.dates + EXPORT_TOTAL_COLUMNS
+
+    def rows(self):
+        for c in self.classrooms:
+            class_id = str(c["_id"])
+            met = self.sessions.get(class_id, set())
+            total = len(met)
+            for sid in c.get("students", []):
+                stu = self.students.get(str(sid))
+                if not stu:
+                    continue
+                present = self.presence.get((class_id, str(sid)), set())
+                cells = []
+                for d in self.dates:
+                    if d in present:
+                        cells.append("P")
+                    elif d in met:
+                        cells.append("A")
+                    else:
+                        cells.append("")     # class did not meet that day
+                attended = len(present)
+                yield [
+                    c.get("courseCode"), c.get("subjectName"), c.get("section"), c.get("semester"),
+                    stu.get("usn"), stu.get("name"),
+                    *cells,
+                    total, attended, percent(attended, total),
+                ]
+
+    async def row_batches(self):
+        batch = []
+        for row in self.rows():
+            batch.append(row)
+            if len(batch) >= REPORT_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def to_arrow(self):
+        """Columnar table (requires pyarrow, imported lazily)."""
+        import pyarrow as pa
+
+        columns = [[] for _ in self.columns]
+        for row in self.rows():
+            for col, value in zip(columns, row):
+                col.append(value)
+        arrays = []
+        for name, values in zip(self.columns, columns):
+            if name in self.dates:
+                values = [v or None for v in values]
+            arrays.append(pa.array(values))
+        return pa.Table.from_arrays(arrays, names=self.columns)
+
+
+def export_bytes(export, fmt):
+    """Parquet / Arrow stream file of an export (blocking, run in a thread)."""
+    return arrow_bytes(export.to_arrow(), fmt)
+
+
+def arrow_bytes(table, fmt):
+    import pyarrow as pa
+
+    sink = BytesIO()
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, sink, compression="zstd")
+    else:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue()
@@ -0,0 +1,130 @@
+import json
+import os
+
+import anyio.to_thread
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder, IdentityResponder
+
+try:
+    import orjson
+except ImportError:     # stdlib fallback, same JSON out
+    orjson = None
+
+try:
+    import brotli
+except ImportError:     # gzip only
+    brotli = None
+
+# ---------------------------
+# JSON rendering + compression
+# ---------------------------
+# FastJSONResponse renders with orjson: datetimes, numpy arrays and (via
+# _default) ObjectIds are handled natively, so handlers can return Mongo
+# documents as they come. It is the app's default response class; large
+# payloads return it directly, which also skips FastAPI's jsonable_encoder
+# walk over every field.
+#
+# CompressionMiddleware negotiates br (when the brotli package is
+# installed) or gzip for bodies of at least RESPONSE_COMPRESS_MIN_BYTES.
+# SSE, images and already compressed content are left alone. The br path
+# plugs into Starlette's IdentityResponder hooks, which are not public API:
+# starlette is pinned in requirements.txt, re-test when moving it.
+
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "5"))
+
+_THREAD_COMPRESS_BYTES = 128 * 1024
+
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(content):
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+else:
+    def dumps(content):
+        content = jsonable_encoder(content, custom_encoder={ObjectId: str})
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content):
+        return dumps(content)
+
+
+# ---------- compression ----------
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app, minimum_size, quality=RESPONSE_BROTLI_QUALITY, **kwargs):
+        super().__init__(app, minimum_size, **kwargs)
+        self.quality = quality
+        self._compressor = None
+
+    async def apply_compression(self, body, *, more_body):
+        if len(body) >= _THREAD_COMPRESS_BYTES:
+            # big chunks would block the event loop
+            return await anyio.to_thread.run_sync(self._compress, body, more_body)
+        return self._compress(body, more_body)
+
+    def _compress(self, body, more_body):
+        if self._compressor is None:
+            self._compressor = brotli.Compressor(quality=self.quality)
+        out = self._compressor.process(body)
+        return out + (self._compressor.flush() if more_body else self._compressor.finish())
+
+
+def _accepted(accept_encoding):
+    """Accept-Encoding -> {coding: q} (q=0 means refused)."""
+    out = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding:
+            out[coding.lower()] = q
+    return out
+
+
+class CompressionMiddleware(GZipMiddleware):
+    def __init__(self, app, minimum_size=RESPONSE_COMPRESS_MIN_BYTES,
+                 compresslevel=RESPONSE_GZIP_LEVEL, brotli_quality=RESPONSE_BROTLI_QUALITY):
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        accepted = _accepted(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli is not None and accepted.get("br", 0) > 0:
+            responder = BrotliResponder(
+                self.app, self.minimum_size, quality=self.brotli_quality,
+                exclude_content_types=self.exclude_content_types,
+            )
+        elif accepted.get("gzip", 0) > 0:
+            responder = GZipResponder(
+                self.app, self.minimum_size, compresslevel=self.compresslevel,
+                thread_minimum_size=self.thread_minimum_size,
+                exclude_content_types=self.exclude_content_types,
+            )
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size, exclude_content_types=self.exclude_content_types)
+        await responder(scope, receive, send)
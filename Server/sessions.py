@@ -0,0 +1,133 @@
+from datetime import datetime
+
+import numpy as np
+from bson import Binary, ObjectId
+from pymongo import ReturnDocument
+
+from db import sessions_col, counters_col
+
+# ---------------------------
+# attendance sessions (one class meeting)
+# ---------------------------
+# one document per (class, date), opened by the first face session of the
+# day (or /session/start) and finalized by the teacher or when the next
+# meeting of the class opens:
+#   open:      {roster: [student ids at start], presentIds: [...]}
+#   finalized: {roster, present: <bitmap over roster>, presentCount}
+# "classes taken" is the number of sessions, kept in the class counters
+# (attendance_counters.sessions) so reading it is O(1).
+
+
+def pack_present(roster, present_ids):
+    """roster order -> little-endian bitmap bytes (bit i = roster[i] present)."""
+    present = set(present_ids)
+    bits = np.fromiter((sid in present for sid in roster), dtype=bool, count=len(roster))
+    return np.packbits(bits, bitorder="little").tobytes()
+
+
+def unpack_present(roster, bitmap):
+    bits = np.unpackbits(np.frombuffer(bitmap, dtype=np.uint8), count=len(roster), bitorder="little")
+    return [roster[i] for i in np.flatnonzero(bits).tolist()]
+
+
+def present_ids(session):
+    """Present student ids of a session, open or finalized."""
+    if session.get("finalizedAt") is None:
+        return list(session.get("presentIds") or [])
+    return unpack_present(session.get("roster") or [], bytes(session.get("present") or b""))
+
+
+def session_view(session, with_present=False):
+    roster = session.get("roster") or []
+    view = {
+        "_id": str(session["_id"]),
+        "classId": str(session["class_id"]),
+        "date": session["date"],
+        "startedAt": session.get("startedAt"),
+        "finalizedAt": session.get("finalizedAt"),
+        "rosterSize": len(roster),
+        "presentCount": session.get("presentCount", len(session.get("presentIds") or [])),
+    }
+    if with_present:
+        view["present"] = present_ids(session)
+    return view
+
+
+async def finalize_session(session):
+    """Pack the present set of an open session into its roster bitmap."""
+    if session.get("finalizedAt") is not None:
+        return session
+    present = list(session.get("presentIds") or [])
+    # students who joined after the session opened go at the end of the roster
+    roster = list(session.get("roster") or [])
+    known = set(roster)
+    roster += [sid for sid in present if sid not in known]
+    return await sessions_col.find_one_and_update(
+        {"_id": session["_id"], "finalizedAt": None},
+        {
+            "$set": {
+                "roster": roster,
+                "present": Binary(pack_present(roster, present)),
+                "presentCount": len(set(present)),
+                "finalizedAt": datetime.utcnow(),
+            },
+            "$unset": {"presentIds": ""},
+        },
+        return_document=ReturnDocument.AFTER,
+    ) or session
+
+
+async def _reopen(session):
+    return await sessions_col.find_one_and_update(
+        {"_id": session["_id"]},
+        {
+            "$set": {"presentIds": present_ids(session), "finalizedAt": None},
+            "$unset": {"present": "", "presentCount": ""},
+        },
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def open_session(classroom, date):
+    """Today's session of a classroom, created on first use.
+
+    A new session bumps the class session counter and finalizes any
+    earlier meeting left open. A finalized session of the same date is
+    reopened (a late photo of the same lecture).
+    """
+    class_id = ObjectId(classroom["_id"])
+    now = datetime.utcnow()
+    result = await sessions_col.update_one(
+        {"class_id": class_id, "date": date},
+        {"$setOnInsert": {
+            "startedAt": now,
+            "finalizedAt": None,
+            "roster": [str(s) for s in classroom.get("students", [])],
+            "presentIds": [],
+        }},
+        upsert=True,
+    )
+    session = await sessions_col.find_one({"class_id": class_id, "date": date})
+
+    if result.upserted_id is not None:
+        # no upsert: a class without counters is recounted on its next read
+        await counters_col.update_one({"_id": class_id}, {"$inc": {"sessions": 1}})
+        async for stale in sessions_col.find({"class_id": class_id, "date": {"$lt": date}, "finalizedAt": None}):
+            await finalize_session(stale)
+    elif session.get("finalizedAt") is not None:
+        session = await _reopen(session)
+    return session
+
+
+async def record_present(session, student_ids):
+    if not student_ids:
+        return
+    await sessions_col.update_one(
+        {"_id": session["_id"]},
+        {"$addToSet": {"presentIds": {"$each": [str(s) for s in student_ids]}},
+         "$set": {"updatedAt": datetime.utcnow()}},
+    )
+
+
+async def session_dates(class_id):
+    return await sessions_col.distinct("date", {"class_id": ObjectId(class_id)})
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# the app modules import `db`, which must connect to the in-memory stand-in
+SERVER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER)
+sys.path.insert(0, os.path.join(SERVER, "bench"))
+
+import standin  # noqa: E402
+
+standin.install()
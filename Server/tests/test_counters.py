@@ -0,0 +1,92 @@
+"""attendance_counters against the in-memory stand-in (bench/standin.py)."""
+import asyncio
+
+from bson import ObjectId
+
+from db import counters_col
+from attendance import (
+    class_attendance_counts, init_counters, mark_present, rebuild_counters, verify_counters,
+)
+from sessions import open_session
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _new_class(students=3):
+    class_id = ObjectId()
+    roster = [str(ObjectId()) for _ in range(students)]
+    await init_counters(class_id)
+    return {"_id": class_id, "students": roster}
+
+
+async def _meeting(classroom, date, present):
+    await open_session(classroom, date)
+    return await mark_present(classroom["_id"], present, date)
+
+
+def test_resent_session_counts_once():
+    async def go():
+        cls = await _new_class()
+        a, b, _ = cls["students"]
+        first = await _meeting(cls, "2025-03-01", [a, b])
+        again = await _meeting(cls, "2025-03-01", [a, b])
+        total, attended = await class_attendance_counts(cls["_id"])
+        return first, again, total, attended, await verify_counters(cls["_id"])
+
+    first, again, total, attended, mismatch = run(go())
+    assert len(first) == 2 and again == []
+    assert total == 1
+    assert set(attended.values()) == {1}
+    assert mismatch is None
+
+
+def test_counts_follow_sessions_and_rows():
+    async def go():
+        cls = await _new_class()
+        a, b, c = cls["students"]
+        await _meeting(cls, "2025-03-01", [a, b])
+        await _meeting(cls, "2025-03-02", [a])
+        await _meeting(cls, "2025-03-03", [])       # nobody recognised still counts
+        full = await class_attendance_counts(cls["_id"])
+        one = await class_attendance_counts(cls["_id"], [b, c])
+        return a, b, full, one, await verify_counters(cls["_id"])
+
+    a, b, (total, attended), (one_total, one), mismatch = run(go())
+    assert total == 3 and one_total == 3
+    assert attended[a] == 2 and attended[b] == 1
+    assert one == {b: 1}
+    assert mismatch is None
+
+
+def test_verify_reports_drift_and_rebuild_fixes_it():
+    async def go():
+        cls = await _new_class()
+        a = cls["students"][0]
+        await _meeting(cls, "2025-03-01", [a])
+        await counters_col.update_one({"_id": cls["_id"]}, {"$inc": {f"present.{a}": 5, "sessions": 2}})
+        drift = await verify_counters(cls["_id"])
+        rebuilt = await rebuild_counters(cls["_id"])
+        return a, drift, rebuilt, await verify_counters(cls["_id"])
+
+    a, drift, rebuilt, after = run(go())
+    assert drift["stored"] == {"sessions": 3, "present": {a: 6}}
+    assert drift["raw"] == {"sessions": 1, "present": {a: 1}}
+    assert rebuilt == (1, {a: 1})
+    assert after is None
+
+
+def test_missing_counters_are_rebuilt_on_read():
+    async def go():
+        cls = await _new_class()
+        a = cls["students"][0]
+        await _meeting(cls, "2025-03-01", [a])
+        await counters_col.delete_one({"_id": cls["_id"]})
+        counts = await class_attendance_counts(cls["_id"], [a])
+        return a, counts, await counters_col.find_one({"_id": cls["_id"]})
+
+    a, counts, doc = run(go())
+    assert counts == (1, {a: 1})
+    assert doc["sessions"] == 1
+
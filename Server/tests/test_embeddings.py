@@ -0,0 +1,46 @@
+"""Packed face embedding blobs (embeddings.py)."""
+import numpy as np
+import pytest
+
+from embeddings import FORMAT_VERSION, _HEADER, pack_embeddings, unpack_embeddings
+
+
+def _vectors(n=3, dim=128, seed=0):
+    return np.random.default_rng(seed).normal(0, 0.1, (n, dim)).astype(np.float32)
+
+
+def test_float32_round_trip_is_exact():
+    vecs = _vectors()
+    blob = pack_embeddings(vecs, dtype="float32")
+    assert len(blob) == _HEADER.size + vecs.nbytes
+    out = unpack_embeddings(blob)
+    assert out.dtype == np.float32 and out.shape == (3, 128)
+    assert np.array_equal(out, vecs)
+
+
+def test_float16_round_trip_is_close():
+    vecs = _vectors()
+    blob = pack_embeddings(vecs, dtype="float16")
+    assert len(blob) == _HEADER.size + vecs.nbytes // 2
+    out = unpack_embeddings(blob)
+    assert out.dtype == np.float32 and out.shape == (3, 128)
+    # far below the 0.45 match tolerance
+    assert np.linalg.norm(out - vecs, axis=1).max() < 1e-2
+
+
+def test_single_vector_and_legacy_lists():
+    vec = _vectors(1)[0]
+    assert unpack_embeddings(pack_embeddings(vec, dtype="float32")).shape == (1, 128)
+    assert unpack_embeddings([vec.tolist()]).shape == (1, 128)
+    assert unpack_embeddings(vec.tolist()).shape == (1, 128)
+    assert unpack_embeddings([]) is None and unpack_embeddings(None) is None
+
+
+def test_unknown_header_is_rejected():
+    body = _vectors(1).tobytes()
+    with pytest.raises(ValueError):
+        unpack_embeddings(_HEADER.pack(FORMAT_VERSION + 1, 1, 128, 1) + body)
+    with pytest.raises(ValueError):
+        unpack_embeddings(_HEADER.pack(FORMAT_VERSION, 9, 128, 1) + body)
+    with pytest.raises(ValueError):
+        pack_embeddings(_vectors(1), dtype="float64")
@@ -0,0 +1,61 @@
+"""EncodingPool recovering from a dead worker (real spawn processes)."""
+import asyncio
+import os
+import signal
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from encoder_pool import EncodeResult, EncodingPool
+
+
+# worker side: no dlib here, the pool only needs something picklable
+def _echo(image_bytes, options):
+    if image_bytes == b"die":
+        os._exit(1)
+    return EncodeResult([], [], {"total_ms": 0.0}, size=(len(image_bytes), 1))
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def _pool():
+    return EncodingPool(workers=1, job=_echo, initializer=None)
+
+
+def test_killed_worker_is_replaced():
+    async def go():
+        pool = _pool()
+        try:
+            first = await pool.encode(b"one")
+            for pid in list(pool._executor._processes):
+                os.kill(pid, signal.SIGKILL)
+            second = await pool.encode(b"three")
+            return first, second, pool.stats()
+        finally:
+            pool.shutdown()
+
+    first, second, stats = run(go())
+    assert first.size == (3, 1) and second.size == (5, 1)
+    assert stats["restarts"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_only_the_crashing_job_fails():
+    async def go():
+        pool = _pool()
+        try:
+            with pytest.raises(BrokenProcessPool):
+                await pool.encode(b"die")
+            after = await pool.encode(b"ok")
+            return after, pool.stats()
+        finally:
+            pool.shutdown()
+
+    after, stats = run(go())
+    assert after.size == (2, 1)
+    # broke the first pool, then its retry broke the second
+    assert stats["restarts"] == 2
+    assert stats["failed"] == 1 and stats["completed"] == 1
+    assert stats["in_flight"] == 0
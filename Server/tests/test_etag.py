@@ -0,0 +1,40 @@
+"""ETags: the If-None-Match comparison and a conditional GET of /me."""
+import os
+
+# API role only: no encoder pool / face index (the live bus runs on the stand-in)
+os.environ.setdefault("WORKER_ROLE", "api")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from auth import create_token  # noqa: E402
+from db import users_col  # noqa: E402
+from etag import etag_matches, make_etag  # noqa: E402
+
+
+def test_etag_matches():
+    tag = make_etag("me", "u1", 3)
+    assert tag.startswith('W/"')
+    assert etag_matches(tag, tag)
+    assert etag_matches(tag[2:], tag)                  # weak comparison
+    assert etag_matches(f'W/"other", {tag}', tag)      # list of tags
+    assert etag_matches("*", tag)
+    assert not etag_matches(make_etag("me", "u1", 4), tag)
+    assert not etag_matches(None, tag) and not etag_matches("", tag)
+
+
+def test_me_answers_304_until_the_user_changes():
+    with TestClient(main.app) as client:
+        client.portal.call(users_col.insert_one, {"name": "E", "email": "etag@x", "password": "p"})
+        auth = {"Authorization": f"Bearer {create_token('etag@x')}"}
+
+        first = client.get("/me", headers=auth)
+        tag = first.headers["etag"]
+        assert first.status_code == 200 and "rev" not in first.json()["user"]
+
+        hit = client.get("/me", headers={**auth, "If-None-Match": tag})
+        assert hit.status_code == 304 and hit.headers["etag"] == tag and hit.content == b""
+
+        client.portal.call(users_col.update_one, {"email": "etag@x"}, {"$inc": {"rev": 1}})
+        miss = client.get("/me", headers={**auth, "If-None-Match": tag})
+        assert miss.status_code == 200 and miss.headers["etag"] != tag
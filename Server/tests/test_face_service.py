@@ -0,0 +1,97 @@
+"""ClassGallery matching and the GalleryCache LRU (bench/standin.py users)."""
+import asyncio
+from datetime import datetime, timedelta
+
+import numpy as np
+from bson import ObjectId
+
+from db import users_col
+from embeddings import pack_embeddings
+from face_service import ClassGallery, GalleryCache
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def _face(seed):
+    vec = np.random.default_rng(seed).normal(0, 1, 128)
+    # unit length: two different seeds are ~1.4 apart, well over tolerance
+    return (vec / np.linalg.norm(vec)).astype(np.float32)
+
+
+def _student(seed, enrolled=None):
+    _id = ObjectId()
+    return {
+        "_id": _id,
+        "email": f"{_id}@x",
+        "name": f"S{seed}",
+        "usn": f"U{seed}",
+        "face_id": {"embeddings": pack_embeddings([_face(seed)], dtype="float32"),
+                    "enrolledAt": enrolled or datetime.utcnow()},
+    }
+
+
+def _gallery(*seeds):
+    docs = [_student(s) for s in seeds]
+    gallery = ClassGallery("c")
+    gallery.set_students(docs)
+    return gallery, [str(d["_id"]) for d in docs]
+
+
+def test_match_picks_the_closest_student():
+    gallery, (a, b, _) = _gallery(1, 2, 3)
+    noise = np.random.default_rng(9).normal(0, 0.01, 128).astype(np.float32)
+    found = gallery.match([_face(2) + noise, _face(1)])
+    assert [m["student_id"] for m in found] == [a, b]
+    assert found[0]["distance"] == 0.0 and found[0]["name"] == "S1"
+
+
+def test_match_threshold_and_one_face_per_student():
+    gallery, (a, _) = _gallery(1, 2)
+    # a stranger is not matched to anyone
+    assert gallery.match([_face(50)]) == []
+    # two faces close to the same student: only the closer one counts
+    near = _face(1) + 0.01
+    found = gallery.match([near, _face(1)])
+    assert len(found) == 1 and found[0]["student_id"] == a and found[0]["distance"] == 0.0
+    # a tighter tolerance drops the near face too
+    assert gallery.match([near], tolerance=0.01) == []
+
+
+def test_cache_evicts_least_recently_used():
+    async def go():
+        classes = []
+        for seed in range(3):
+            doc = _student(seed)
+            await users_col.insert_one(doc)
+            classes.append({"_id": ObjectId(), "students": [str(doc["_id"])]})
+        cache = GalleryCache(users_col, max_galleries=2)
+        first = await cache.get(classes[0])
+        await cache.get(classes[1])
+        again = await cache.get(classes[0])       # 0 is now the most recent
+        await cache.get(classes[2])               # ... so 1 is dropped
+        return classes, cache, first, again
+
+    classes, cache, first, again = run(go())
+    assert again is first
+    assert list(cache._galleries) == [str(classes[0]["_id"]), str(classes[2]["_id"])]
+
+
+def test_cache_picks_up_reenrollment():
+    async def go():
+        doc = _student(1, enrolled=datetime.utcnow() - timedelta(days=1))
+        await users_col.insert_one(doc)
+        classroom = {"_id": ObjectId(), "students": [str(doc["_id"])]}
+        cache = GalleryCache(users_col, sync_seconds=0)
+        before = (await cache.get(classroom)).match([_face(7)])
+        await users_col.update_one({"_id": doc["_id"]}, {"$set": {
+            "face_id.embeddings": pack_embeddings([_face(7)], dtype="float32"),
+            "face_id.enrolledAt": datetime.utcnow(),
+        }})
+        after = (await cache.get(classroom)).match([_face(7)])
+        return doc, before, after
+
+    doc, before, after = run(go())
+    assert before == []
+    assert [m["student_id"] for m in after] == [str(doc["_id"])]
@@ -0,0 +1,246 @@
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from pymongo import monitoring
+
+# ---------------------------
+# request tracing + metrics
+# ---------------------------
+# TracingMiddleware opens a Trace per request (kept in a contextvar, so it
+# follows the request through every await). Handlers mark stages with
+#
+#     with span("match"):
+#         ...
+#
+# or record(stage, ms) for work timed elsewhere (the encoder processes).
+# A pymongo CommandListener counts the Mongo commands of the request.
+# Everything lands in Prometheus histograms served by /metrics, and each
+# response carries Server-Timing + X-Mongo-Ops headers.
+#
+# With TRACING_ENABLED=0 (default) the middleware and the listener are not
+# installed; span() returns a shared no-op object and record() returns
+# after one contextvar lookup.
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "0") == "1"
+
+# seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+OPS_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_current = ContextVar("trace", default=None)
+
+
+class Trace:
+    __slots__ = ("stages", "mongo_ops", "mongo_seconds")
+
+    def __init__(self):
+        self.stages = {}            # stage -> seconds (summed if repeated)
+        self.mongo_ops = 0
+        self.mongo_seconds = 0.0
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+
+class _Span:
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name):
+    trace = _current.get()
+    if trace is None:
+        return _NOOP
+    return _Span(trace, name)
+
+
+def record(stage, ms):
+    """Add a stage measured elsewhere (milliseconds)."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(stage, ms / 1000)
+
+
+def record_stages(timings):
+    """Encoder timings dict ({"decode_ms": ..}) -> stages (totals skipped)."""
+    trace = _current.get()
+    if trace is None:
+        return
+    for key, ms in timings.items():
+        if key.endswith("_ms") and key != "total_ms":
+            trace.add(key[:-3], ms / 1000)
+
+
+# ---------- metrics ----------
+def _label_text(names, values):
+    return ",".join(f'{n}="{v}"' for n, v in zip(names, values))
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}           # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+        idx = bisect_left(self.buckets, value)
+        if idx < len(self.buckets):
+            series[idx] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, series in sorted(self._series.items()):
+            labels = _label_text(self.labels, values)
+            sep = "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels}{sep}le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{labels}}} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, total in sorted(self._values.items()):
+            lines.append(f"{self.name}{{{_label_text(self.labels, values)}}} {total}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency by route.",
+    ("method", "route", "status"), LATENCY_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "request_stage_duration_seconds", "Time spent per request stage.",
+    ("route", "stage"), LATENCY_BUCKETS,
+)
+MONGO_OPS = Histogram(
+    "request_mongo_ops", "Mongo commands issued per request.",
+    ("route",), OPS_BUCKETS,
+)
+MONGO_COMMANDS = Counter("mongo_commands_total", "Mongo commands by name.", ("command",))
+MONGO_FAILURES = Counter("mongo_command_failures_total", "Failed Mongo commands by name.", ("command",))
+
+METRICS = (REQUEST_SECONDS, STAGE_SECONDS, MONGO_OPS, MONGO_COMMANDS, MONGO_FAILURES)
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+# ---------- mongo ----------
+class MongoOpListener(monitoring.CommandListener):
+    """Counts commands per request (the async client runs them in the
+    calling task, so the request's contextvar is visible here)."""
+
+    def started(self, event):
+        trace = _current.get()
+        if trace is not None:
+            trace.mongo_ops += 1
+
+    def succeeded(self, event):
+        MONGO_COMMANDS.inc(event.command_name)
+        trace = _current.get()
+        if trace is not None:
+            trace.mongo_seconds += event.duration_micros / 1e6
+
+    def failed(self, event):
+        MONGO_COMMANDS.inc(event.command_name)
+        MONGO_FAILURES.inc(event.command_name)
+
+
+def mongo_listeners():
+    """event_listeners for the Mongo client ([] when tracing is off)."""
+    return [MongoOpListener()] if TRACING_ENABLED else []
+
+
+# ---------- middleware ----------
+class TracingMiddleware:
+    """Pure ASGI middleware (works with streaming responses)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        trace = Trace()
+        token = _current.set(trace)
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_traced(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                headers = list(message.get("headers", []))
+                timing = [f"{name};dur={sec * 1000:.1f}" for name, sec in trace.stages.items()]
+                timing.append(f"mongo;dur={trace.mongo_seconds * 1000:.1f}")
+                timing.append(f"total;dur={(time.perf_counter() - started) * 1000:.1f}")
+                headers.append((b"server-timing", ", ".join(timing).encode()))
+                headers.append((b"x-mongo-ops", str(trace.mongo_ops).encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            # route template keeps the label set small (/class/{class_id}, not ids)
+            route = getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - started, scope["method"], route, str(status[0]))
+            for stage, seconds in trace.stages.items():
+                STAGE_SECONDS.observe(seconds, route, stage)
+            if trace.mongo_ops:
+                STAGE_SECONDS.observe(trace.mongo_seconds, route, "mongo")
+            MONGO_OPS.observe(trace.mongo_ops, route)